@@ -0,0 +1,120 @@
+import gzip
+import json
+
+from flask import Blueprint, Response, request
+
+from cube import MEASURES
+from top_n import TOP_N
+
+# -------------------------------------------------------------------------------------------------------------------------
+# JSON api with the numbers of the dashboard, answered from the same aggregates as the callbacks (DataStore).
+#   GET  /api/aggregates/monthly?year=2013&segment=Consumer&category=Technology
+#   GET  /api/aggregates/countries?year=2013
+#   GET  /api/aggregates/markets?year=2013
+#   GET  /api/aggregates/timeseries?start=2013-01-01&end=2013-12-31&granularity=week&window=28&yoy=1
+#   GET  /api/aggregates/top?dimension=Product Name&year=2013&category=Technology&n=20&measure=Profit
+#   POST /api/aggregates/batch  {"queries": [{"type": "monthly", "year": 2013}, {"type": "markets"}]}
+# The responses have an ETag (If-None-Match gives 304 Not Modified) and are gzip compressed when the client accepts it.
+
+MAX_BATCH_QUERIES = 100
+MIN_COMPRESS_BYTES = 512
+
+
+def get_year(value):
+    return None if value in (None, '') else int(value)
+
+
+def frame_records(df):
+    return json.loads(df.to_json(orient='records'))
+
+
+def monthly_query(store, year=None, segment=None, category=None):
+    monthly_data = store.monthly(get_year(year), segment, category)
+    result = {'order_month': monthly_data['order_month'].tolist()}
+    for measure in MEASURES:
+        result[measure] = monthly_data[measure].tolist()
+    return result
+
+
+def countries_query(store, year=None):
+    return frame_records(store.map_data(get_year(year)))
+
+
+def markets_query(store, year=None):
+    return frame_records(store.market_data(get_year(year)).reset_index())
+
+
+def timeseries_query(store, start=None, end=None, granularity='month', segment=None, category=None, window=None,
+                     yoy=None):
+    series = store.time_series(start or None, end or None, granularity or 'month', segment, category,
+                               int(window) if window else None, str(yoy).lower() in ('1', 'true'))
+    series = series.assign(date=series['date'].dt.strftime('%Y-%m-%d'))
+    return frame_records(series)
+
+
+def top_query(store, dimension='Sub-Category', year=None, segment=None, category=None, n=None, measure=None):
+    return frame_records(store.top(dimension or 'Sub-Category', get_year(year), segment, category,
+                                   int(n) if n else TOP_N, measure or 'Sales'))
+
+
+QUERIES = {
+    'monthly': (monthly_query, ['year', 'segment', 'category']),
+    'countries': (countries_query, ['year']),
+    'markets': (markets_query, ['year']),
+    'timeseries': (timeseries_query, ['start', 'end', 'granularity', 'segment', 'category', 'window', 'yoy']),
+    'top': (top_query, ['dimension', 'year', 'segment', 'category', 'n', 'measure']),
+}
+
+
+def run_query(store, query_type, parameters):
+    if query_type not in QUERIES:
+        raise ValueError('unknown query type: {}'.format(query_type))
+    query, names = QUERIES[query_type]
+    return query(store, **{name: parameters.get(name) for name in names})
+
+
+# json response with etag and compression
+def json_response(result):
+    response = Response(json.dumps(result, separators=(',', ':')), mimetype='application/json')
+    response.add_etag()
+    response = response.make_conditional(request)
+    response.vary.add('Accept-Encoding')
+
+    if response.status_code == 200 and 'gzip' in request.headers.get('Accept-Encoding', '') \
+            and response.content_length >= MIN_COMPRESS_BYTES:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def error_response(message, status=400):
+    return Response(json.dumps({'error': message}), status=status, mimetype='application/json')
+
+
+# get_store returns the DataStore of the app, or None while it's loading
+def create_api(get_store):
+    api = Blueprint('aggregates', __name__, url_prefix='/api/aggregates')
+
+    def answer(compute):
+        store = get_store()
+        if store is None:
+            return error_response('the data is not loaded yet', 503)
+        try:
+            return json_response(compute(store))
+        except (ValueError, TypeError) as error:
+            return error_response(str(error))
+
+    @api.route('/<query_type>', methods=['GET'])
+    def single_query(query_type):
+        return answer(lambda store: run_query(store, query_type, request.args))
+
+    @api.route('/batch', methods=['POST'])
+    def batch_query():
+        body = request.get_json(silent=True)
+        queries = body.get('queries') if isinstance(body, dict) else None
+        if not isinstance(queries, list) or len(queries) > MAX_BATCH_QUERIES \
+                or not all(isinstance(query, dict) for query in queries):
+            return error_response('queries must be a list of at most {} queries (objects)'.format(MAX_BATCH_QUERIES))
+        return answer(lambda store: {'results': [run_query(store, query.get('type'), query) for query in queries]})
+
+    return api
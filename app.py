@@ -1,51 +1,66 @@
+import copy
+import io
+import json
+import os
+import threading
+
 import pandas as pd
-import numpy as np
 import plotly.express as px
 
 import dash
 from dash import html
 from dash import dcc, callback_context
-from dash import Input, Output
+from dash.exceptions import PreventUpdate
+from dash import Input, Output, State, ClientsideFunction, Patch
 import dash_bootstrap_components as dbc
+from flask import request, jsonify
+
+from api import create_api
+from compact_map import CITY_BINS, COMPACT_MAP, COMPACT_MAP_HOVER, SIZE_MAX, get_map_base, set_map_numbers
+from cube import MEASURES
+from dataset import load_store
+from figure_cache import FigureCache, figure_to_json
+from ingest import INCOMING_FOLDER, prepare_batch, save_batch, watch_folder
+from metrics import DEBUG_PANEL, METRICS, metrics
+from database import BACKEND, load_database_store
+from out_of_core import OUT_OF_CORE, load_chunked_store
+from profiling import profiled
+from startup import Startup
+from timeseries import date_range
+from top_n import TOP_MEASURES, TOP_N
 
 # -------------------------------------------------------------------------------------------------------------------------
-# read dataset
-data = pd.read_csv('Data/data_complete_with_iso.csv')
-print(data.columns)
-
-# get the year of the date
-data['Order Date'] = pd.to_datetime(data['Order Date'], infer_datetime_format=True)
-data['order_year'] = data['Order Date'].dt.year
+# read dataset, the dates are already parsed in the cache with the year and the month of the order date
+# and the measures are pre-aggregated per year, month, segment and category in the cube for the callbacks
+# the store also keeps the aggregates up to date when new orders are appended (see ingest.py)
+# the data is read in a background thread (load_app_data at the end of the file), the server shows a loading
+# page until it's ready and /api/startup reports the time of every phase of the startup
+store = None
+ingested_files = set()
+fig_pie_segment = None
+fig_pie_category = None
+startup = Startup()
 
-# get the month of the date
-data['order_month'] = data['Order Date'].dt.month
+# how long a callback waits for the data when the app is not ready yet
+STARTUP_WAIT = 30
 
-# plot revenue verse year
-#sales_per_years = data.groupby(['order_year', 'order_month']).sum()
-
-# pie chart for segment per sales
-sales_per_segment = data.groupby('Segment').sum()
-sales_per_segment.reset_index(inplace=True)
 
 # colors pie
 colors = ['#645565', '#ceb4b7', '#e2e0eb']
-fig_pie_segment = px.pie(sales_per_segment, values='Sales', names='Segment', hole=.6, width=90, height=90,
-                         template='presentation',
-                         hover_data=['Segment'])
-
-fig_pie_segment.update_traces(marker=dict(colors=colors))
-fig_pie_segment.update_layout(margin=dict(l=0, r=20, t=4, b=7))
 
-# pie chart for Cateogory per sales
-sales_per_category = data.groupby('Category').sum()
-sales_per_category.reset_index(inplace=True)
 
-fig_pie_category = px.pie(sales_per_category, values='Sales', names='Category', hole=.6, width=90, height=90,
-                          template='presentation',
-                          hover_data=['Category'])
+# pie chart of the sales per segment or per category, the selected one is pulled out
+@profiled('plotly')
+def draw_graph_Pie(sales, names, selected=None):
+    fig = px.pie(sales, values='Sales', names=names, hole=.6, width=90, height=90,
+                 template='presentation',
+                 hover_data=[names])
 
-fig_pie_category.update_traces(marker=dict(colors=colors))
-fig_pie_category.update_layout(margin=dict(l=0, r=20, t=4, b=7))
+    fig.update_traces(marker=dict(colors=colors))
+    if selected is not None:
+        fig.update_traces(pull=[0.15 if name == selected else 0 for name in sales[names]])
+    fig.update_layout(margin=dict(l=0, r=20, t=4, b=7))
+    return fig
 
 
 # --------------------------------------------------------------------------------------------------------#
@@ -53,61 +68,18 @@ fig_pie_category.update_layout(margin=dict(l=0, r=20, t=4, b=7))
 # Function For Map Graph
 
 
-# first get the orderCount and the total sales for each country
-def get_country_orders(df):
-    country_orders = df.groupby("Country").agg({'Order ID': 'count', 'Sales': 'sum'})
-    country_orders.rename(columns={"Order ID": "OrderCount_Per_Country", "Sales": "TotalSales_Per_Country"},
-                          inplace=True)
-    country_orders["TotalSales_Per_Country"] = np.round(country_orders["TotalSales_Per_Country"])
-    return country_orders
-
-
-# then get the order counte,totalsales,total profit for each Market
-def get_market_order(df):
-    Markets_Order = df.groupby("Market").agg({'Order ID': 'count', 'Sales': 'sum', 'Profit': 'sum'})
-    Markets_Order.rename(columns={"Order ID": "OrderCount_Per_Market", "Sales": "TotalSales_Per_Market",
-                                  "Profit": "TotalProfit_Per_Market"}, inplace=True)
-    Markets_Order["TotalSales_Per_Market"] = np.round(Markets_Order["TotalSales_Per_Market"])
-    Markets_Order["TotalProfit_Per_Market"] = np.round(Markets_Order["TotalProfit_Per_Market"])
-    return Markets_Order
-
-
-# then get the iso_alpha data for each country
-def get_iso_market(df):
-    country_iso_Market = pd.DataFrame(df.loc[:, ['Country', 'Market', 'iso_alpha']].groupby("Country"),
-                                      columns=["Country", "Market"])
-    iso_alpha = []
-    for index in range(country_iso_Market.shape[0]):
-        Market_name = list(country_iso_Market.Market[index]['Market'].unique())[0]
-        iso = list(country_iso_Market.Market[index]['iso_alpha'].unique())[0]
-        iso_alpha.append(iso)
-        country_iso_Market.Market[index] = Market_name
-    country_iso_Market['iso_alpha'] = iso_alpha
-    return country_iso_Market
-
-
-# merge all the data
-def Create_DataFrame_For_Map(df):
-    country_order = get_country_orders(df)
-    country_iso = get_iso_market(df)
-    market_order = get_market_order(df)
-
-    data1 = country_iso.join(country_order, how='inner', on='Country')
-    total_data = data1.merge(market_order, how="left", on="Market")
-    return total_data
-
-
 # draw the map graph for countries
-def draw_graph_Map(df):
-    data_country_Market = Create_DataFrame_For_Map(df)
+# in the compact mode the numbers of the hover are not columns of the traces, they are set by set_map_numbers
+@profiled('plotly')
+def draw_graph_Map(data_country_Market, compact=False):
+    hover_data = {"iso_alpha": False, "TotalSales_Per_Country": True, "OrderCount_Per_Country": True,
+                  "TotalSales_Per_Market": True, "OrderCount_Per_Market": True}
     fig = px.scatter_geo(data_country_Market, locations="iso_alpha", color="Market",
 
                          hover_name="Country",
-                         hover_data={"iso_alpha": False, "TotalSales_Per_Country": True,
-                                     "OrderCount_Per_Country": True, "TotalSales_Per_Market": True,
-                                     "OrderCount_Per_Market": True},
+                         hover_data={"iso_alpha": False} if compact else hover_data,
                          size="TotalSales_Per_Country",  # size of markers, "pop" is one of the columns of gapminder
-                         size_max=25,
+                         size_max=SIZE_MAX,
                          width=800,
                          color_discrete_sequence=px.colors.qualitative.G10
                          # color_discrete_sequence=['green']
@@ -120,6 +92,18 @@ def draw_graph_Map(df):
         font=dict(size=10)
     ))
     fig.update_layout(margin=dict(l=2, r=2, t=10, b=7))
+    if compact:
+        fig.update_traces(hovertemplate=COMPACT_MAP_HOVER)
+    return fig
+
+
+# sales of the top cities of a country, drill-down of the map in the compact mode
+@profiled('plotly')
+def draw_graph_Cities(city_sales):
+    fig = px.bar(city_sales, x='Sales', y='City', orientation='h', template='presentation',
+                 color_discrete_sequence=px.colors.qualitative.G10)
+    fig.update_yaxes(categoryorder='array', categoryarray=list(city_sales['City'])[::-1], title=None)
+    fig.update_layout(margin=dict(l=12, r=12, t=10, b=7))
     return fig
 
 
@@ -130,8 +114,9 @@ def draw_graph_Map(df):
 # use the function for order_Data for Market
 # and then plot bar graph for profit
 
-def draw_graph_Market_Profit(df):
-    df_Market = get_market_order(df)
+@profiled('plotly')
+def draw_graph_Market_Profit(df_Market):
+    df_Market = df_Market.copy()
     df_Market['Market'] = df_Market.index
     fig = px.bar(df_Market, x='Market', y='TotalProfit_Per_Market',
                  color='TotalProfit_Per_Market', color_continuous_scale="Brwnyl")
@@ -142,378 +127,752 @@ def draw_graph_Market_Profit(df):
     return fig
 
 
+# draw the monthly performance of the measure y (monthly data of the filters, see DataStore.monthly)
+@profiled('plotly')
+def draw_graph_Performance(filter_data, y, color):
+    month = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'June', 'Jul',
+             'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+    fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
+    fig.update_traces(marker_color=color, line_color=color)
+
+    # fig.update_layout(transition_duration=500)
+    fig.update_layout(xaxis=dict(showgrid=False, title='Months'),
+                      yaxis=dict(showgrid=True))
+    return fig
+
+
+# measure of a time series (see DataStore.time_series) with its rolling sum and the year before
+@profiled('plotly')
+def draw_graph_TimeSeries(series, y, color, window=None, yoy=False):
+    fig = px.line(series, x='date', y=y, template='presentation')
+    fig.update_traces(line_color=color, name=y, showlegend=True)
+    if window:
+        fig.add_scatter(x=series['date'], y=series[y + '_rolling'], mode='lines',
+                        name='{} days rolling'.format(window), line=dict(color=color, dash='dash'))
+    if yoy:
+        fig.add_scatter(x=series['date'], y=series[y + '_last_year'], mode='lines', name='Year before',
+                        customdata=series[y + '_yoy'], line=dict(color='#999', dash='dot'),
+                        hovertemplate='%{y:,.0f} (%{customdata:+.1%} this year)<extra>Year before</extra>')
+    fig.update_layout(xaxis=dict(showgrid=False, title=None), yaxis=dict(showgrid=True, title=y),
+                      legend=dict(orientation='h', yanchor='bottom', y=1.02, x=0),
+                      margin=dict(l=60, r=20, t=30, b=40))
+    return fig
+
+
+TIMESERIES_GRANULARITIES = ['day', 'week', 'month', 'quarter']
+ROLLING_WINDOWS = [7, 30, 90]
+
+
+# table of the top items of a dimension (see DataStore.top), the money measures with a dollar sign
+def draw_table_Top(top_data):
+    table = top_data.copy()
+    table.insert(0, '#', range(1, len(table) + 1))
+    for column in ['Sales', 'Profit']:
+        table[column] = ['${:,}'.format(round(value)) for value in table[column]]
+    for column in ['Quantity', 'Orders']:
+        table[column] = ['{:,}'.format(round(value)) for value in table[column]]
+    return dbc.Table.from_dataframe(table, striped=True, hover=True, size='sm',
+                                    style={'font-size': '0.8vw', 'margin': '0'})
+
+
+# id of the table of every dimension of the top-N panel
+TOP_TABLES = {'Sub-Category': 'top_sub_categories', 'City': 'top_cities', 'Product Name': 'top_products'}
+
+# ------------------------------------------------------------------------------------------------------- #
+# draw the monthly chart in the browser, the server only sends the monthly data of the filters
+CLIENTSIDE_CHART = os.environ.get('SUPERSTORE_CLIENTSIDE_CHART', '0') == '1'
+
+# chart of the sales without filters, the browser replaces its measure in the clientside mode
+performance_figure = None
+
 # ------------------------------------------------------------------------------------------------------- #
 # create the app
-app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+# the components of the dashboard are not in the loading page
+app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+server = app.server
 
-app.layout = html.Div(
-    [
-        # ------------------------------------------- Header --------------------------------- #
+# figures of all the callbacks, keyed by their filters and the version of the dataset
+figure_cache = FigureCache(int(os.environ.get('SUPERSTORE_FIGURE_CACHE_MB', 64)) * 1024 * 1024)
 
-        html.Div
-        (
-            [
-                html.P("Superstore Sales Analysis",
-                       style={'margin': '0% 6%', 'color': 'rgb(246 239 239)', 'font-size': '2.3vw',
-                              'display': 'inline-block', 'width': '60%'}
-                       ),
+# run the heavy callbacks (map, time series) in background processes with SUPERSTORE_BACKGROUND_CALLBACKS=1,
+# so a slow callback doesn't keep a thread of the server. Their results are kept in a diskcache by inputs and
+# version of the dataset, the other users who pick the same inputs get them without computing them again.
+# It needs pip install "dash[diskcache]", there is no broker to run.
+# The jobs are processes forked from the server (multiprocess.Process), which has other threads: the store is
+# locked while forking so the job gets it in a consistent state, and the job gets new locks and single-flights, the
+# ones it inherits may be held by threads which don't exist in it (see after_fork_in_child).
+BACKGROUND_CALLBACKS = os.environ.get('SUPERSTORE_BACKGROUND_CALLBACKS', '0') == '1'
+BACKGROUND_CACHE_DIR = 'Data/.cache/callbacks'
+background = {}
+if BACKGROUND_CALLBACKS:
+    import diskcache
 
-                html.Div
-                (
-                    [
-                        dcc.Dropdown
-                        (
-                            list(data['order_year'].value_counts().sort_index().index),
-                            value = None,
-                            placeholder="Select a Year",
-                            id='year-slider',
-                            style={'width': '100%',  }
-                        ),
-                    ],
-                    style={'display':'inline-block', 'width':'15%', 'margin':'auto 3vh auto 18vh', 'padding-top':'3vh'}
-                )
-            ],
-            style={'min-height': '12vh', 'background': 'rgb(43 42 62)', 'width': '100%'}
-        ),
-
-        # ------------------------------------------- Kpis Pans ------------------------------#
-        html.Div
+    background = dict(background=True, manager=dash.DiskcacheManager(
+        diskcache.Cache(BACKGROUND_CACHE_DIR), cache_by=[lambda: None if store is None else store.version],
+        expire=3600))
+
+
+# lock of the store taken by the thread which forks a job
+fork_lock = None
+
+
+def before_fork():
+    global fork_lock
+    fork_lock = None if store is None else store.lock
+    if fork_lock is not None:
+        fork_lock.acquire()
+
+
+def after_fork_in_parent():
+    if fork_lock is not None:
+        fork_lock.release()
+
+
+def after_fork_in_child():
+    global map_base_lock, layout_lock
+    map_base_lock = threading.Lock()
+    layout_lock = threading.Lock()
+    figure_cache.reset_after_fork()
+    metrics.reset_after_fork()
+    if store is not None:
+        store.reset_after_fork()
+
+
+if BACKGROUND_CALLBACKS:
+    os.register_at_fork(before=before_fork, after_in_parent=after_fork_in_parent, after_in_child=after_fork_in_child)
+
+
+# the server is alive while the data is loading
+@server.route('/api/health')
+def health():
+    return jsonify(alive=True)
+
+
+# ready when the data is loaded, with the time of every phase of the startup
+@server.route('/api/startup')
+def startup_status():
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+# wait for the data in the callbacks, a worker may get a callback before it's ready
+def wait_until_ready():
+    if not startup.wait(STARTUP_WAIT):
+        raise PreventUpdate
+
+
+# numbers of the dashboard for the other tools (see api.py)
+server.register_blueprint(create_api(lambda: store if startup.wait(STARTUP_WAIT) else None))
+
+
+@server.route('/api/figure-cache')
+def figure_cache_stats():
+    return jsonify(figure_cache.stats())
+
+
+# hits and misses of the caches of the app for the metrics (see metrics.py), the memo of the store is added to them
+def get_cache_counts():
+    stats = figure_cache.stats()
+    return {'figures': (stats['hits'], stats['misses'])}
+
+
+# append a batch of new orders sent as CSV, enabled with SUPERSTORE_APPEND_API=1
+if os.environ.get('SUPERSTORE_APPEND_API', '0') == '1':
+    @server.route('/api/orders', methods=['POST'])
+    def append_orders():
+        if not startup.wait(STARTUP_WAIT):
+            return jsonify(error='the data is not loaded yet'), 503
+        # the batch is checked before it's saved, a bad file in the incoming folder would fail in every watcher
+        try:
+            batch = pd.read_csv(io.BytesIO(request.get_data()))
+            prepared = prepare_batch(batch, store.dtypes, store.iso_codes)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, KeyError, ValueError) as error:
+            return jsonify(error='invalid batch: {}'.format(error)), 400
+        save_batch(batch, ingested_files, INCOMING_FOLDER)
+        store.append(prepared)
+        return jsonify(rows=len(batch), version=store.version)
+
+# the dashboard, created when the data is loaded and again when new orders were appended (see serve_layout)
+def create_layout():
+    return html.Div(
+        [
+            # ------------------------------------------- Header --------------------------------- #
+
+            html.Div
             (
-            [
+                [
+                    html.P("Superstore Sales Analysis",
+                           style={'margin': '0% 6%', 'color': 'rgb(246 239 239)', 'font-size': '2.3vw',
+                                  'display': 'inline-block', 'width': '60%'}
+                           ),
 
-                html.Button
-                    (
-                    [
-                        html.H4('Total Sales', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.7vw'}),
-                        html.P(id='sales_kpi', style={'text-align': 'center', 'font-size': '1.5vw', 'margin':'0vh auto 1vh '})
-                    ],
-                    n_clicks=0,
-                    id='bt_sales',
-                    style={'border-bottom': '7px solid rgb(137 186 130)', 'border-radius': '5px',
-                           'height': '15vh',
-                           'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
-                           'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 10vh'
-                           }
-                ),
-
-                html.Button
-                    (
-                    [
-                        html.H4('Total Profits', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.7vw'}),
-                        html.P('470', id='profits_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
-                    ],
-                    n_clicks=0,
-                    id='bt_profits',
-                    style={'border-bottom': '7px solid rgb(212 135 178)', 'border-radius': '5px',
-                           'height': '15vh',
-                           'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
-                           'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 3vh'}
-                ),
-
-                html.Button
+                    html.Div
                     (
-                    [
-                        html.H4('Total Quantity', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.6vw'}),
-                        html.P('470', id='quantity_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
-                    ],
-                    n_clicks=0,
-                    id='bt_quantity',
-                    style={'border-bottom': '7px solid rgb(205 136 72)', 'border-radius': '5px',
-                           'height': '15vh',
-                           'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
-                           'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 3vh'}
-                ),
-
-                html.Button
-                    (
-                    [
-                        html.H4('Total Discount', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.6vw'}),
-                        html.P('470', id='discount_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
-                    ],
-                    n_clicks=0,
-                    id='bt_discount',
-                    style={'border-bottom': '7px solid rgb(116 156 183)', 'border-radius': '5px',
-                           'height': '15vh',
-                           'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
-                           'padding': '20px', 'width': '16%', 'margin': '0vh 0vh 0vh 0vh'}
-                )
-            ],
-            style={'display': 'flex', 'flex-direction': 'row', 'flex-wrap': 'wrap', 'justify': 'center',
-                   'min-height': '15vh', 'text-align': 'center', 'width': '100%', 'margin': '5% 10% 3% 10%'}
-        ),
-
-        # ---------------------------- sales performance with filters ----------------------------- #
-
-        html.Div
-        (
-            [
-                html.Div
-                (
-                    [
-                        html.H3
-                            ("Performance of Sales",
-                            id='sales_title', style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw',
-                                                     'color': '#444', 'width': '50%'}
-                        ),
-                        html.Div
-                            (
-                            [
-                                dcc.Dropdown
-                                    (
-                                    data['Segment'].unique(),
-                                    placeholder="Select a Segment",
-                                    id='segment_checklist',
-                                    style={'width': '100%', 'height': '7vh', 'font-size': '1vw'}
-                                ),
-                            ],
-                            style={'width': '20%', 'margin-right': '5%'}
-                        ),
-
-                        html.Div
+                        [
+                            dcc.Dropdown
                             (
-                            [
-                                dcc.Dropdown
-                                (
-                                    data['Category'].unique(),
-                                    placeholder="Select a Category",
-                                    id='category_checklist',
-                                    style={'width': '100%', 'height': '7vh',
-                                           }
-                                )
-                            ],
-                            style={'width': '20%'}
-                        )
-                    ],
-                    style={'display': 'flex', 'flex-direction': 'row', 'flex-wrap': 'wrap',
-                           'height': '10vh', 'width': '100%'},
-                ),
-
-                html.Div
+                                sorted(store.values('order_year')),
+                                value = None,
+                                placeholder="Select a Year",
+                                id='year-slider',
+                                style={'width': '100%',  }
+                            ),
+                        ],
+                        style={'display':'inline-block', 'width':'15%', 'margin':'auto 3vh auto 18vh', 'padding-top':'3vh'}
+                    )
+                ],
+                style={'min-height': '12vh', 'background': 'rgb(43 42 62)', 'width': '100%'}
+            ),
+
+            # ------------------------------------------- Kpis Pans ------------------------------#
+            html.Div
                 (
-                    [
-                        html.Div
-                            (
-                            [
-                                dcc.Graph(id='sales_year_graph', responsive=True)
-                            ],
-                            style={'border': '1px solid #ddd', 'border-radius': '15px',
-                                   'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height': '60vh',
-                                   'margin': '4vh 1vh 1vh 1vh', 'background-color': 'white', 'overflow': 'hidden'}
-                        ),
-
-                    ],
-                    style={'display': 'inline-block', 'height':'100%',
-                           'width': '60%', 'overflow': 'hidden', 'vertical-align': 'top'}
-                ),
-
-                html.Div
+                [
+
+                    html.Button
+                        (
+                        [
+                            html.H4('Total Sales', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.7vw'}),
+                            html.P(id='sales_kpi', style={'text-align': 'center', 'font-size': '1.5vw', 'margin':'0vh auto 1vh '})
+                        ],
+                        n_clicks=0,
+                        id='bt_sales',
+                        style={'border-bottom': '7px solid rgb(137 186 130)', 'border-radius': '5px',
+                               'height': '15vh',
+                               'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
+                               'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 10vh'
+                               }
+                    ),
+
+                    html.Button
+                        (
+                        [
+                            html.H4('Total Profits', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.7vw'}),
+                            html.P('470', id='profits_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
+                        ],
+                        n_clicks=0,
+                        id='bt_profits',
+                        style={'border-bottom': '7px solid rgb(212 135 178)', 'border-radius': '5px',
+                               'height': '15vh',
+                               'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
+                               'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 3vh'}
+                    ),
+
+                    html.Button
+                        (
+                        [
+                            html.H4('Total Quantity', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.6vw'}),
+                            html.P('470', id='quantity_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
+                        ],
+                        n_clicks=0,
+                        id='bt_quantity',
+                        style={'border-bottom': '7px solid rgb(205 136 72)', 'border-radius': '5px',
+                               'height': '15vh',
+                               'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
+                               'padding': '20px', 'width': '16%', 'margin': '0vh 13vh 0vh 3vh'}
+                    ),
+
+                    html.Button
+                        (
+                        [
+                            html.H4('Total Discount', style={'margin': 'auto', 'text-align': 'center', 'font-size':'1.6vw'}),
+                            html.P('470', id='discount_kpi', style={'text-align': 'center', 'font-size': '1.5vw'})
+                        ],
+                        n_clicks=0,
+                        id='bt_discount',
+                        style={'border-bottom': '7px solid rgb(116 156 183)', 'border-radius': '5px',
+                               'height': '15vh',
+                               'box-shadow': 'rgba(60, 64, 67, 0.3) 0px 1px 2px 0px, rgba(60, 64, 67, 0.15) 0px 2px 6px 2px',
+                               'padding': '20px', 'width': '16%', 'margin': '0vh 0vh 0vh 0vh'}
+                    )
+                ],
+                style={'display': 'flex', 'flex-direction': 'row', 'flex-wrap': 'wrap', 'justify': 'center',
+                       'min-height': '15vh', 'text-align': 'center', 'width': '100%', 'margin': '5% 10% 3% 10%'}
+            ),
+
+            # ---------------------------- sales performance with filters ----------------------------- #
+
+            html.Div
+            (
+                [
+                    html.Div
                     (
-                    [
-                        html.Div
-                            (
-                            [
-                                html.P('Segment', style={'margin': '1vh', 'font-size': '1.2vw',
-                                                         'text-align': 'center', 'color': '#444'}),
+                        [
+                            html.H3
+                                ("Performance of Sales",
+                                id='sales_title', style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw',
+                                                         'color': '#444', 'width': '50%'}
+                            ),
+                            html.Div
+                                (
+                                [
+                                    dcc.Dropdown
+                                        (
+                                        store.values('Segment'),
+                                        placeholder="Select a Segment",
+                                        id='segment_checklist',
+                                        style={'width': '100%', 'height': '7vh', 'font-size': '1vw'}
+                                    ),
+                                ],
+                                style={'width': '20%', 'margin-right': '5%'}
+                            ),
 
-                                html.Div
+                            html.Div
+                                (
+                                [
+                                    dcc.Dropdown
                                     (
-                                    [
+                                        store.values('Category'),
+                                        placeholder="Select a Category",
+                                        id='category_checklist',
+                                        style={'width': '100%', 'height': '7vh',
+                                               }
+                                    )
+                                ],
+                                style={'width': '20%'}
+                            )
+                        ],
+                        style={'display': 'flex', 'flex-direction': 'row', 'flex-wrap': 'wrap',
+                               'height': '10vh', 'width': '100%'},
+                    ),
+
+                    html.Div
+                    (
+                        [
+                            html.Div
+                                (
+                                [
+                                    dcc.Graph(id='sales_year_graph', responsive=True),
+                                    dcc.Store(id='monthly_store'),
+                                    dcc.Store(id='performance_figure', data=performance_figure),
+                                ],
+                                style={'border': '1px solid #ddd', 'border-radius': '15px',
+                                       'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height': '60vh',
+                                       'margin': '4vh 1vh 1vh 1vh', 'background-color': 'white', 'overflow': 'hidden'}
+                            ),
+
+                        ],
+                        style={'display': 'inline-block', 'height':'100%',
+                               'width': '60%', 'overflow': 'hidden', 'vertical-align': 'top'}
+                    ),
+
+                    html.Div
+                        (
+                        [
+                            html.Div
+                                (
+                                [
+                                    html.P('Segment', style={'margin': '1vh', 'font-size': '1.2vw',
+                                                             'text-align': 'center', 'color': '#444'}),
+
+                                    html.Div
+                                        (
+                                        [
+                                            html.Div
+                                                (
+                                                [
+                                                    dcc.Graph(figure=fig_pie_segment, id='pie_segment',
+                                                              responsive=True, style={'height': '100%'})
+                                                ],
+                                                style={'height': '23vh'}
+                                            ),
+
+                                        ],
+                                    ),
+                                ],
+                                style={'margin': '2vh', 'border': '1px solid #ddd', 'border-radius': '15px',
+                                       'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px',
+                                       'background-color': 'white', 'overflow': 'hidden', 'height':'30vh'}
+                            ),
+
+                            html.Div
+                                (
+                                [
+                                    html.P('Category', style={'margin': '1vh', 'font-size': '1.2vw',
+                                                              'text-align': 'center', 'color': '#444'}),
+
+                                    html.Div
+                                        ([
                                         html.Div
                                             (
                                             [
-                                                dcc.Graph(figure=fig_pie_segment, id='pie_segment',
-                                                          responsive=True, style={'height': '100%'})
+                                                dcc.Graph(figure=fig_pie_category, id='pie_category',
+                                                          style={'height': '100%'}, responsive=True)
                                             ],
-                                            style={'height': '23vh'}
+                                            style={'height':'23vh'}
                                         ),
 
-                                    ],
-                                ),
-                            ],
-                            style={'margin': '2vh', 'border': '1px solid #ddd', 'border-radius': '15px',
-                                   'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px',
-                                   'background-color': 'white', 'overflow': 'hidden', 'height':'30vh'}
-                        ),
+                                    ]),
+                                ],
+                                style={'margin': '2vh', 'border': '1px solid #ddd', 'border-radius': '15px',
+                                       'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px',
+                                       'background-color': 'white', 'overflow': 'hidden', 'height': '30vh'}
+                            ),
 
-                        html.Div
-                            (
-                            [
-                                html.P('Category', style={'margin': '1vh', 'font-size': '1.2vw',
-                                                          'text-align': 'center', 'color': '#444'}),
+                        ],
+                        style={'margin': '0% 0% 0% 2%', 'width': '38%',
+                               'display': 'inline-block', 'overflow': 'hidden',
+                               'vertical-align': 'top', 'height': '100%'}
+                    ),
+                ],
+                style={'margin': '0% 10%', 'position':'relevent',
+                       'min-height': '70vh', 'width': '100%'}
+            ),
 
-                                html.Div
-                                    ([
-                                    html.Div
-                                        (
-                                        [
-                                            dcc.Graph(figure=fig_pie_category, id='pie_category',
-                                                      style={'height': '100%'}, responsive=True)
-                                        ],
-                                        style={'height':'23vh'}
-                                    ),
+            # ------------------------------- measures over time with date range ------------------------------ #
 
-                                ]),
-                            ],
-                            style={'margin': '2vh', 'border': '1px solid #ddd', 'border-radius': '15px',
-                                   'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px',
-                                   'background-color': 'white', 'overflow': 'hidden', 'height': '30vh'}
-                        ),
-
-                    ],
-                    style={'margin': '0% 0% 0% 2%', 'width': '38%',
-                           'display': 'inline-block', 'overflow': 'hidden',
-                           'vertical-align': 'top', 'height': '100%'}
-                ),
-            ],
-            style={'margin': '0% 10%', 'position':'relevent',
-                   'min-height': '70vh', 'width': '100%'}
-        ),
-
-        # --------------------------------- top 10 sub categories and cities ------------------------------- #
-
-        html.Div
-            (
-            [
-                html.H3("OverView to Countries and Market Sales",
-                        style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw',
-                                                  'color': '#444', 'width': '50%'}
-                        ),
-                html.Div
+            create_timeseries_panel(),
+
+            # --------------------------------- top 10 sub categories and cities ------------------------------- #
+
+            create_top_panel(),
+
+            # ------------------------------------- countries and markets ------------------------------------- #
+
+            html.Div
                 (
-                    [
-                        html.Div(
-                            [
-                                html.H4(id='my_title_map', style={'margin': '1vh 3vh 1vh'}),
-                            ]
-                        ),
-
-                        html.Div
-                        (
-                            [
-                                dcc.Graph(id='map_Country_Market', responsive=True , style={'height': '100%'})
-                            ],
-                            style={'margin': '1vh','vertical-align': 'top'}
-                        )
-                    ],
-                    style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
-                           'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height':'90%',
-                           'display': 'inline-block', 'width': '60%', 'margin': '5vh 3vh 5vh 1vh', }
-                ),
-
-                html.Div
+                [
+                    html.H3("OverView to Countries and Market Sales",
+                            style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw',
+                                                      'color': '#444', 'width': '50%'}
+                            ),
+                    html.Div
                     (
-                    [
-                        html.Div(
-                            [
-                                html.H4(id='my_title_market', style={'margin': '1vh 3vh 1vh'}),
-                            ]
-                        ),
-
-                        html.Div
+                        [
+                            html.Div(
+                                [
+                                    html.H4(id='my_title_map', style={'margin': '1vh 3vh 1vh'}),
+                                ]
+                            ),
+
+                            html.Div
+                            (
+                                [
+                                    dcc.Graph(id='map_Country_Market', responsive=True , style={'height': '100%'}),
+                                    dcc.Store(id='map_base_key'),
+                                ],
+                                style={'margin': '1vh','vertical-align': 'top'}
+                            )
+                        ],
+                        style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
+                               'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height':'90%',
+                               'display': 'inline-block', 'width': '60%', 'margin': '5vh 3vh 5vh 1vh', }
+                    ),
+
+                    html.Div
                         (
-                            [
-                                dcc.Graph(id='Map_Market_Profit', responsive=True)
-                            ],
-                            style={'margin': '1vh 3vh ', 'vertical-align': 'top'}
-                        )
-                    ],
-                    style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
-                           'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height':'90%',
-                           'display': 'inline-block', 'width': '35%', 'margin': '0% 0% 0% 2%'}
-                ),
-
-            ],
-            style={'margin': '0% 10%', 'min-height': '70vh', 'width': '100%', 'padding':'10vh 0vh', 'border-top': '1px solid #ddd'}
-        )
+                        [
+                            html.Div(
+                                [
+                                    html.H4(id='my_title_market', style={'margin': '1vh 3vh 1vh'}),
+                                ]
+                            ),
+
+                            html.Div
+                            (
+                                [
+                                    dcc.Graph(id='Map_Market_Profit', responsive=True)
+                                ],
+                                style={'margin': '1vh 3vh ', 'vertical-align': 'top'}
+                            )
+                        ],
+                        style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
+                               'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'height':'90%',
+                               'display': 'inline-block', 'width': '35%', 'margin': '0% 0% 0% 2%'}
+                    ),
+
+                    # drill-down of the map in the compact mode, when the rows of the orders are in memory
+                    *([create_cities_panel()] if COMPACT_MAP and store.keeps_rows else []),
+                ],
+                style={'margin': '0% 10%', 'min-height': '70vh', 'width': '100%', 'padding':'10vh 0vh', 'border-top': '1px solid #ddd'}
+            ),
+
+            # ------------------------------------------ debug panel ------------------------------------------ #
+
+            *([create_debug_panel()] if DEBUG_PANEL else []),
+        ],
+        style={'background': '#f6f5f5', 'box-sizing': 'border-box', 'min-height': '100vh', 'width': '100%',
+               'display': 'flex', 'flex-wrap': 'wrap'}
+    )
+
+
+# measures of a date range per day, week, month or quarter with the filters of the performance chart
+def create_timeseries_panel():
+    first_day, last_day = date_range(store.daily)
+    return html.Div(
+        [
+            html.Div
+            (
+                [
+                    html.H3("Sales Over Time", id='timeseries_title',
+                            style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw', 'color': '#444', 'width': '40%'}),
+                    dcc.DatePickerRange(id='date_range', min_date_allowed=first_day.date(),
+                                        max_date_allowed=last_day.date(), start_date=first_day.date(),
+                                        end_date=last_day.date(), display_format='YYYY-MM-DD'),
+                    dcc.Dropdown(MEASURES, value='Sales', clearable=False, id='timeseries_measure',
+                                 style={'width': '12vw', 'margin-left': '2vh'}),
+                ],
+                style={'display': 'flex', 'flex-direction': 'row', 'flex-wrap': 'wrap', 'align-items': 'center',
+                       'width': '100%'}
+            ),
+
+            html.Div
+            (
+                [
+                    dcc.RadioItems([{'label': granularity.capitalize(), 'value': granularity}
+                                    for granularity in TIMESERIES_GRANULARITIES],
+                                   value='month', inline=True, id='granularity',
+                                   inputStyle={'margin': '0vh 0.5vh 0vh 2vh'}),
+                    dcc.Dropdown([{'label': '{} days rolling'.format(days), 'value': days} for days in ROLLING_WINDOWS],
+                                 placeholder='Rolling window', id='rolling_window',
+                                 style={'width': '12vw', 'margin-left': '3vh'}),
+                    dcc.Checklist([{'label': 'Compare with the year before', 'value': 'yoy'}], value=[],
+                                  id='yoy', inputStyle={'margin': '0vh 0.5vh 0vh 3vh'}),
+                ],
+                style={'display': 'flex', 'flex-direction': 'row', 'align-items': 'center', 'margin': '2vh 3vh'}
+            ),
+
+            html.Div
+            (
+                [
+                    dcc.Graph(id='timeseries_graph', responsive=True)
+                ],
+                style={'border': '1px solid #ddd', 'border-radius': '15px', 'background-color': 'white',
+                       'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'margin': '1vh', 'overflow': 'hidden'}
+            ),
+        ],
+        style={'margin': '0% 10%', 'width': '100%', 'padding': '5vh 0vh', 'border-top': '1px solid #ddd'}
+    )
+
+
+# the top sub-categories, cities and products of the filters of the header and the performance chart
+def create_top_panel():
+    return html.Div(
+        [
+            html.Div
+            (
+                [
+                    html.H3("Top {} Sub-Categories, Cities and Products".format(TOP_N), id='top_title',
+                            style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw', 'color': '#444', 'width': '60%'}),
+                    dcc.Dropdown(TOP_MEASURES, value='Sales', clearable=False, id='top_measure',
+                                 style={'width': '12vw', 'margin-left': '2vh'}),
+                ],
+                style={'display': 'flex', 'flex-direction': 'row', 'align-items': 'center', 'width': '100%'}
+            ),
+
+            *[html.Div
+              (
+                [
+                    html.H4(dimension, style={'margin': '1vh 3vh 1vh', 'font-size': '1.3vw'}),
+                    html.Div(id=table_id, style={'margin': '1vh 2vh'}),
+                ],
+                style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
+                       'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px', 'display': 'inline-block',
+                       'vertical-align': 'top', 'width': '25%' if dimension == 'Sub-Category' else '35%',
+                       'margin': '4vh 1vh 1vh 1vh', 'overflow': 'hidden'}
+            ) for dimension, table_id in TOP_TABLES.items()],
+        ],
+        style={'margin': '0% 10%', 'width': '100%', 'padding': '5vh 0vh', 'border-top': '1px solid #ddd'}
+    )
+
+
+# sales of the cities of the country clicked on the map
+def create_cities_panel():
+    return html.Div(
+        [
+            html.Div(
+                [
+                    html.H4('Click on a country to see the sales of its cities', id='my_title_cities',
+                            style={'margin': '1vh 3vh 1vh'}),
+                ]
+            ),
+
+            html.Div
+            (
+                [
+                    dcc.Graph(id='city_graph', responsive=True)
+                ],
+                style={'margin': '1vh 3vh ', 'vertical-align': 'top'}
+            )
+        ],
+        style={'border': '1px solid white', 'border-radius': '25px', 'background-color': 'white',
+               'box-shadow': 'rgb(144 143 169) 1px 7px 7px 1px',
+               'display': 'inline-block', 'width': '97%', 'margin': '0vh 3vh 5vh 1vh'}
+    )
+
+
+# metrics of the callbacks, the caches and the memory, updated every few seconds (SUPERSTORE_DEBUG_PANEL=1)
+def create_debug_panel():
+    return html.Div(
+        [
+            html.H3("Debug", style={'margin': '0vh 0vh 0vh 5vh', 'font-size': '1.9vw', 'color': '#444'}),
+            html.Div(id='debug_metrics', style={'margin': '2vh 3vh', 'font-size': '0.8vw'}),
+            dcc.Interval(id='debug_interval', interval=5000),
+        ],
+        style={'margin': '0% 10%', 'width': '100%', 'padding': '5vh 0vh', 'border-top': '1px solid #ddd'}
+    )
+
+
+# page shown while the data is loading, it reloads itself when the app is ready
+loading_layout = html.Div(
+    [
+        html.P('Loading the data...', id='startup_status',
+               style={'margin': 'auto', 'color': '#444', 'font-size': '1.5vw'}),
+        dcc.Interval(id='startup_interval', interval=1000),
+        dcc.Store(id='startup_ready'),
     ],
-    style={'background': '#f6f5f5', 'box-sizing': 'border-box', 'min-height': '100vh', 'width': '100%',
-           'display': 'flex', 'flex-wrap': 'wrap'}
+    style={'background': '#f6f5f5', 'min-height': '100vh', 'width': '100%', 'display': 'flex'}
 )
+# (version of the store, dashboard), the dashboard is created again when new orders were appended so the options of
+# the year, segment and category dropdowns and the dates of the time series have the new ones
+main_layout = None
+layout_lock = threading.Lock()
 
 
-@app.callback(
-    Output('sales_year_graph', 'figure'),
-    Output('sales_title', 'children'),
-
-    Input('segment_checklist', 'value'),
-    Input('category_checklist', 'value'),
-    Input('bt_sales', 'n_clicks'),
-    Input('bt_profits', 'n_clicks'),
-    Input('bt_quantity', 'n_clicks'),
-    Input('bt_discount', 'n_clicks'),
-    Input('year-slider', 'value'),
-)
-def update_graph(segment_options, category_options, bts, btp, btq, btd, year):
+def serve_layout():
+    global main_layout
+    if not startup.ready:
+        return loading_layout
+    with layout_lock:
+        if main_layout[0] != store.version:
+            main_layout = (store.version, create_layout())
+        return main_layout[1]
 
-    month = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'June', 'Jul',
-             'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
-    if year == None:
-        filter_data = data
+app.layout = serve_layout
 
-    else:
-        year = int(year)
-        filter_data = data[data['order_year'] == year]
 
-    # filter data based on segment and category
-    if(segment_options == None) and (category_options == None):
-        filter_data = filter_data
+@app.callback(
+    Output('startup_status', 'children'),
+    Output('startup_ready', 'data'),
+    Input('startup_interval', 'n_intervals'),
+)
+def update_startup_status(n_intervals):
+    status = startup.status()
+    if status['error']:
+        return 'The data could not be loaded', False
+    return 'Loading the data ({})...'.format(status['phase'] or 'starting'), status['ready']
 
-    elif segment_options == None:
-        filter_data = filter_data[filter_data['Category'] == category_options]
 
-    elif category_options == None:
-        filter_data = filter_data[filter_data['Segment'] == segment_options]
+app.clientside_callback(
+    "function(ready) { if (ready) { window.location.reload(); } return null; }",
+    Output('startup_interval', 'disabled'),
+    Input('startup_ready', 'data'),
+)
 
-    else:
-        filter_data = filter_data[(filter_data['Segment'] == segment_options) & (filter_data['Category'] == category_options)]
 
+# measure and color of the performance chart for every KPI button, the sales when no button was clicked
+KPI_BUTTONS = {
+    'bt_sales': ('Sales', 'rgb(137,186, 130)'),
+    'bt_profits': ('Profit', 'rgb(212, 135,178)'),
+    'bt_quantity': ('Quantity', 'rgb(205, 136, 72)'),
+    'bt_discount': ('Discount', 'rgb(116, 156 ,183)'),
+}
 
-    #print(filter_data.columns)
-    filter_data = filter_data.groupby(['order_month']).sum()
-    filter_data.reset_index(inplace=True)
-    print(filter_data)
 
-    #sales_per_years = data.groupby(['order_year', 'order_month']).sum()
-    #sales_per_year = sales_per_years.loc[year]
-    #sales_per_year.reset_index(inplace=True)
+# performance chart of the measure y for the filters with its title
+def get_performance_graph(segment_options, category_options, year, y, color):
+    title = 'Performance of {}'.format(y)
 
-    changed_id = [p['prop_id'] for p in callback_context.triggered][0]
-    if 'bt_sales' in changed_id:
-        y = 'Sales'
-        fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
-        fig.update_traces(marker_color='rgb(137,186, 130)', line_color='rgb(137,186, 130)')
-
-    elif 'bt_profits' in changed_id:
-        y = 'Profit'
-        fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
-        fig.update_traces(marker_color='rgb(212, 135,178)', line_color='rgb(212, 135,178)')
-
-    elif 'bt_quantity' in changed_id:
-        y = 'Quantity'
-        fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
-        fig.update_traces(marker_color='rgb(205, 136, 72)', line_color='rgb(205 ,136, 72)')
-    elif 'bt_discount' in changed_id:
-        y = 'Discount'
-        fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
-        fig.update_traces(marker_color='rgb(116, 156 ,183)', line_color='rgb(116, 156 ,183)')
-    else:
-        y = 'Sales'
-        fig = px.line(filter_data, x=month, y=y, markers=True, template='presentation',)
-        fig.update_traces(marker_color='rgb(137,186, 130)', line_color='rgb(137,186, 130)')
+    year = None if year is None else int(year)
+    # get the monthly data of the filters, shared with update_kpi
+    fig = figure_cache.get(('performance', year, segment_options, category_options, y), store.version,
+                           lambda: draw_graph_Performance(store.monthly(year, segment_options, category_options),
+                                                          y, color))
 
+    return fig, title
 
-    title = 'Performance of {}'.format(y)
 
-    # fig.update_layout(transition_duration=500)
-    fig.update_layout(xaxis=dict(showgrid=False, title='Months'),
-                      yaxis=dict(showgrid=True))
+@profiled('callback')
+def update_graph(segment_options, category_options, bts, btp, btq, btd, year):
+    wait_until_ready()
 
-    #fig.update_traces(marker_color='rgb(144,143,169)', line_color='rgb(144,143,169)')
-    # fig.show()
+    changed_id = [p['prop_id'] for p in callback_context.triggered][0]
+    y, color = KPI_BUTTONS['bt_sales']
+    for button in KPI_BUTTONS:
+        if button in changed_id:
+            y, color = KPI_BUTTONS[button]
+
+    return get_performance_graph(segment_options, category_options, year, y, color)
+
+# the monthly data of the filters for the clientside mode of the chart
+@profiled('callback')
+def update_monthly_store(segment_options, category_options, year):
+    wait_until_ready()
+    filter_data = store.monthly(year, segment_options, category_options)
+    return {measure: filter_data[measure].round(4).tolist() for measure in MEASURES}
+
+
+# in the clientside mode the server only sends the monthly data when the filters change,
+# the chart is drawn in the browser (assets/clientside.js) when a KPI button is clicked
+if CLIENTSIDE_CHART:
+    app.callback(
+        Output('monthly_store', 'data'),
+
+        Input('segment_checklist', 'value'),
+        Input('category_checklist', 'value'),
+        Input('year-slider', 'value'),
+    )(update_monthly_store)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='superstore', function_name='update_graph'),
+        Output('sales_year_graph', 'figure'),
+        Output('sales_title', 'children'),
+
+        Input('monthly_store', 'data'),
+        Input('bt_sales', 'n_clicks'),
+        Input('bt_profits', 'n_clicks'),
+        Input('bt_quantity', 'n_clicks'),
+        Input('bt_discount', 'n_clicks'),
+        State('performance_figure', 'data'),
+    )
+else:
+    app.callback(
+        Output('sales_year_graph', 'figure'),
+        Output('sales_title', 'children'),
+
+        Input('segment_checklist', 'value'),
+        Input('category_checklist', 'value'),
+        Input('bt_sales', 'n_clicks'),
+        Input('bt_profits', 'n_clicks'),
+        Input('bt_quantity', 'n_clicks'),
+        Input('bt_discount', 'n_clicks'),
+        Input('year-slider', 'value'),
+    )(update_graph)
 
+# ------------------------------------------------------------------------------ #
+# the sums of the buckets come from the prefix sums of the days, they don't depend on the number of orders
+@app.callback(
+    Output('timeseries_graph', 'figure'),
+    Output('timeseries_title', 'children'),
+    Input('date_range', 'start_date'),
+    Input('date_range', 'end_date'),
+    Input('granularity', 'value'),
+    Input('rolling_window', 'value'),
+    Input('yoy', 'value'),
+    Input('timeseries_measure', 'value'),
+    Input('segment_checklist', 'value'),
+    Input('category_checklist', 'value'),
+    **background
+)
+@profiled('callback')
+def update_timeseries(start, end, granularity, window, yoy, y, segment_options, category_options):
+    wait_until_ready()
+    yoy = bool(yoy)
+    color = {measure: color for measure, color in KPI_BUTTONS.values()}[y]
+    series = store.time_series(start, end, granularity, segment_options, category_options, window, yoy)
+
+    total = series[y].sum()
+    title = '{} Over Time: {:,.0f}'.format(y, total)
+    if yoy and series[y + '_last_year'].sum():
+        last_year = series[y + '_last_year'].sum()
+        title += ' ({:+.1%} from the year before)'.format((total - last_year) / abs(last_year))
+    fig = figure_cache.get(('time_series', start, end, granularity, segment_options, category_options, window, yoy, y),
+                           store.version, lambda: draw_graph_TimeSeries(series, y, color, window, yoy))
     return fig, title
 
+
 # ------------------------------------------------------------------------------ #
 
 @app.callback(
@@ -525,33 +884,12 @@ def update_graph(segment_options, category_options, bts, btp, btq, btd, year):
     Input('segment_checklist', 'value'),
     Input('category_checklist', 'value')
 )
+@profiled('callback')
 def update_kpi(year, segment_options, category_options):
+    wait_until_ready()
 
-    if year == None:
-        filter_data = data
-
-    else:
-        year = int(year)
-        filter_data = data[data['order_year'] == year]
-
-
-    # filter data based on segment and category
-    if (segment_options == None) and (category_options == None):
-        filter_data = filter_data
-
-    elif segment_options == None:
-        filter_data = filter_data[filter_data['Category'] == category_options]
-
-    elif category_options == None:
-        filter_data = filter_data[filter_data['Segment'] == segment_options]
-
-    else:
-        filter_data = filter_data[
-            (filter_data['Segment'] == segment_options) & (filter_data['Category'] == category_options)]
-
-    # group by year and month
-    filter_data = filter_data.groupby(['order_month']).sum()
-    filter_data.reset_index(inplace=True)
+    # get the monthly data of the filters, shared with update_graph
+    filter_data = store.monthly(year, segment_options, category_options)
 
     sales = "${:,}".format(round(filter_data['Sales'].sum()))
     profits = '${:,}'.format(round(filter_data['Profit'].sum()))
@@ -562,31 +900,202 @@ def update_kpi(year, segment_options, category_options):
 
 
 # ------------------------------------------------------------------ #
-@app.callback(
-    Output('map_Country_Market', 'figure'),
-    Output('my_title_map', 'children'),
-    Output('Map_Market_Profit', 'figure'),
-    Output('my_title_market', 'children'),
-    Input('year-slider', 'value'),
-)
-def update_graph_screen2(year):
+def get_map_titles(year):
     if year == None:
         title1 = f"Sales Per Country from 2011 to 2014"
         title2 = f"Profit Per Market from 2011 to 2014"
-
-        data_graph = data.copy()
     else:
-        year = int(year)
         title1 = f"Sales Per Country in {year} Year"
         title2 = f"Profit Per Market in{year} Year"
+    return title1, title2
+
 
-        data_graph = data[data['order_year'] == year].copy()
+@profiled('callback')
+def update_graph_screen2(year):
+    wait_until_ready()
+    year = None if year is None else int(year)
+    title1, title2 = get_map_titles(year)
 
-    print(data_graph.columns)
-    fig1 = draw_graph_Map(data_graph)
-    fig2 = draw_graph_Market_Profit(data_graph)
+    # the figures are built only for the years which are not in the cache yet
+    fig1 = figure_cache.get(('map', year), store.version,
+                            lambda: draw_graph_Map(store.map_data(year)))
+    fig2 = figure_cache.get(('market_profit', year), store.version,
+                            lambda: draw_graph_Market_Profit(store.market_data(year)))
 
     return fig1, title1, fig2, title2
 
+
+# base figure of the compact map with all the countries, drawn again when the countries change (see compact_map.py)
+map_base = None
+map_base_lock = threading.Lock()
+
+
+def get_compact_map_base():
+    global map_base
+    with map_base_lock:
+        countries = store.countries
+        if map_base is None or map_base['countries'] is not countries:
+            base_data = countries.reset_index().assign(TotalSales_Per_Country=1)
+            map_base = get_map_base(json.loads(figure_to_json(draw_graph_Map(base_data, compact=True))), countries)
+        return map_base
+
+
+# the browser which already has the base figure only gets the numbers of the year
+@profiled('callback')
+def update_compact_map(year, base_key):
+    wait_until_ready()
+    year = None if year is None else int(year)
+    title1, title2 = get_map_titles(year)
+
+    base = get_compact_map_base()
+    figure = Patch() if base_key == base['key'] else copy.deepcopy(base['figure'])
+    fig1 = set_map_numbers(figure, base, store.map_data(year))
+    fig2 = figure_cache.get(('market_profit', year), store.version,
+                            lambda: draw_graph_Market_Profit(store.market_data(year)))
+
+    return fig1, title1, fig2, title2, base['key']
+
+
+# sales of the cities of the country clicked on the map, the rows are not kept by the other backends
+@profiled('callback')
+def update_cities(click_data, year):
+    wait_until_ready()
+    if click_data is None or not store.keeps_rows:
+        raise PreventUpdate
+    year = None if year is None else int(year)
+    country = click_data['points'][0]['hovertext']
+
+    fig = figure_cache.get(('cities', country, year), store.version,
+                           lambda: draw_graph_Cities(store.city_sales(country, year, CITY_BINS)))
+    return fig, 'Sales Per City in {}'.format(country)
+
+
+if COMPACT_MAP:
+    app.callback(
+        Output('map_Country_Market', 'figure'),
+        Output('my_title_map', 'children'),
+        Output('Map_Market_Profit', 'figure'),
+        Output('my_title_market', 'children'),
+        Output('map_base_key', 'data'),
+        Input('year-slider', 'value'),
+        State('map_base_key', 'data'),
+        **background
+    )(update_compact_map)
+
+    app.callback(
+        Output('city_graph', 'figure'),
+        Output('my_title_cities', 'children'),
+        Input('map_Country_Market', 'clickData'),
+        Input('year-slider', 'value'),
+    )(update_cities)
+else:
+    app.callback(
+        Output('map_Country_Market', 'figure'),
+        Output('my_title_map', 'children'),
+        Output('Map_Market_Profit', 'figure'),
+        Output('my_title_market', 'children'),
+        Input('year-slider', 'value'),
+        **background
+    )(update_graph_screen2)
+
+# ------------------------------------------------------------------ #
+# the top items come from the rankings per year, segment and category, only the N best ones are sorted
+@app.callback(
+    *[Output(table_id, 'children') for table_id in TOP_TABLES.values()],
+    Output('top_title', 'children'),
+    Input('year-slider', 'value'),
+    Input('segment_checklist', 'value'),
+    Input('category_checklist', 'value'),
+    Input('top_measure', 'value'),
+)
+@profiled('callback')
+def update_top_tables(year, segment_options, category_options, measure):
+    wait_until_ready()
+    year = None if year is None else int(year)
+
+    tables = [draw_table_Top(store.top(dimension, year, segment_options, category_options, TOP_N, measure))
+              for dimension in TOP_TABLES]
+    title = 'Top {} Sub-Categories, Cities and Products by {}'.format(TOP_N, measure)
+    return (*tables, title)
+
+
+# ------------------------------------------------------------------ #
+# the segment pie is filtered by the year and the category, the category pie by the year and the segment,
+# both of them come from the totals of the cube
+@app.callback(
+    Output('pie_segment', 'figure'),
+    Output('pie_category', 'figure'),
+    Input('year-slider', 'value'),
+    Input('segment_checklist', 'value'),
+    Input('category_checklist', 'value')
+)
+@profiled('callback')
+def update_pies(year, segment_options, category_options):
+    wait_until_ready()
+
+    year = None if year is None else int(year)
+    fig1 = figure_cache.get(('pie_segment', year, segment_options, category_options), store.version,
+                            lambda: draw_graph_Pie(store.by('Segment', year, category=category_options),
+                                                   'Segment', segment_options))
+    fig2 = figure_cache.get(('pie_category', year, segment_options, category_options), store.version,
+                            lambda: draw_graph_Pie(store.by('Category', year, segment=segment_options),
+                                                   'Category', category_options))
+    return fig1, fig2
+
+
+# ------------------------------------------------------------------ #
+# the tables of the debug panel, the times of the phases are the upper bounds of the buckets of the histograms
+if DEBUG_PANEL:
+    @app.callback(
+        Output('debug_metrics', 'children'),
+        Input('debug_interval', 'n_intervals'),
+    )
+    def update_debug_panel(n_intervals):
+        wait_until_ready()
+        tables = []
+        for table in metrics.summary(store, get_cache_counts):
+            tables.append(dbc.Table.from_dataframe(table.round(2), striped=True, size='sm',
+                                                   style={'margin-bottom': '3vh'}))
+        return tables
+
+# time the callbacks, count the bytes of their responses and serve /metrics (SUPERSTORE_METRICS=1)
+if METRICS:
+    metrics.register(app, lambda: store, get_cache_counts)
+
+# ------------------------------------------------------------------ #
+# load the data and precompute the aggregates and the figures of the dashboard
+def load_app_data():
+    global store, ingested_files, fig_pie_segment, fig_pie_category, performance_figure, main_layout
+
+    # only the aggregates are loaded in the out-of-core mode (see out_of_core.py),
+    # the queries are SQL with the sqlite and duckdb backends (see database.py)
+    with startup.phase('dataset'):
+        if OUT_OF_CORE:
+            store = load_chunked_store()
+        elif BACKEND != 'pandas':
+            store = load_database_store()
+        else:
+            store = load_store()
+
+    with startup.phase('indexes'):
+        store.prepare()
+
+    with startup.phase('pies'):
+        fig_pie_segment = draw_graph_Pie(store.by('Segment'), 'Segment')
+        fig_pie_category = draw_graph_Pie(store.by('Category'), 'Category')
+
+    with startup.phase('layout'):
+        if CLIENTSIDE_CHART:
+            performance_figure = draw_graph_Performance(store.monthly(), *KPI_BUTTONS['bt_sales']).to_plotly_json()
+        main_layout = (store.version, create_layout())
+
+    # append the new orders dropped in the incoming folder while the app is running
+    ingested_files = watch_folder(store)
+
+
+# the workers of the precompute import the main module again (python app.py), they must not load the app
+if __name__ != '__mp_main__':
+    startup.run(load_app_data)
+
 if __name__ == '__main__':
     app.run_server(debug=True)
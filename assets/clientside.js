@@ -0,0 +1,36 @@
+// Clientside mode of the monthly performance chart (SUPERSTORE_CLIENTSIDE_CHART=1).
+// The server sends the monthly measures of the filters once (monthly_store), switching the measure with the
+// KPI buttons only changes the trace of the chart in the browser.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    superstore: {
+        update_graph: function (monthly, bts, btp, btq, btd, baseFigure) {
+            var measures = {
+                bt_sales: ['Sales', 'rgb(137,186, 130)'],
+                bt_profits: ['Profit', 'rgb(212, 135,178)'],
+                bt_quantity: ['Quantity', 'rgb(205, 136, 72)'],
+                bt_discount: ['Discount', 'rgb(116, 156 ,183)']
+            };
+            if (!monthly || !baseFigure) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+
+            // a change of the filters shows the sales, like the server callback
+            var triggered = window.dash_clientside.callback_context.triggered.map(function (t) {
+                return t.prop_id.split('.')[0];
+            });
+            var measure = measures[triggered[0]] || measures.bt_sales;
+            var y = measure[0];
+            var color = measure[1];
+
+            var figure = JSON.parse(JSON.stringify(baseFigure));
+            var trace = figure.data[0];
+            trace.y = monthly[y];
+            trace.marker = Object.assign({}, trace.marker, {color: color});
+            trace.line = Object.assign({}, trace.line, {color: color});
+            trace.hovertemplate = 'x=%{x}<br>' + y + '=%{y}<extra></extra>';
+            figure.layout.yaxis = Object.assign({}, figure.layout.yaxis, {title: {text: y}});
+
+            return [figure, 'Performance of ' + y];
+        }
+    }
+});
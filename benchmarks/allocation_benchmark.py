@@ -0,0 +1,70 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Peak memory allocated (tracemalloc) by one call of the map callback for every year filter, without the figure cache
+# and the memo of the selections, so the map and market data are built again from the totals of the countries.
+# It fails when a call allocates more than --max-fraction of the size of the dataset, e.g. when the callback
+# copies the dataset again.
+# python benchmarks/allocation_benchmark.py --rows 1000000 --max-fraction 0.25
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(rows, max_fraction):
+    folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(folder, 'Data'))
+        write_dataset(rows, os.path.join(folder, 'Data', 'data_complete_with_iso.csv'))
+        os.chdir(folder)
+        import app
+        app.startup.wait()
+
+        dataset_bytes = app.store.data.memory_usage(deep=True).sum()
+        limit = max_fraction * dataset_bytes
+        print('dataset: {:,} rows, {:.1f} MB, limit per call {:.1f} MB'.format(rows, dataset_bytes / 2 ** 20,
+                                                                                limit / 2 ** 20))
+
+        # first call loads the plotly templates
+        app.update_graph_screen2(None)
+
+        failed = False
+        for year in [None] + [int(year) for year in app.store.cube['years']]:
+            app.figure_cache.clear()
+            app.store.clear_selections()
+            peak = measure(app.update_graph_screen2, year)
+            failed |= peak > limit
+            print('update_graph_screen2({!s:>4})  peak={:8.1f} MB  {}'.format(
+                year, peak / 2 ** 20, 'FAIL' if peak > limit else 'ok'))
+        return not failed
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--max-fraction', type=float, default=0.25)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    sys.exit(0 if run(args.rows, args.max_fraction) else 1)
@@ -0,0 +1,91 @@
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Load test of the aggregates api (api.py): every client sends requests in a loop for the duration,
+# the latency percentiles and the throughput are reported per endpoint.
+# python app.py  (or gunicorn --config gunicorn.conf.py app:server)
+# python benchmarks/api_load_test.py --url http://127.0.0.1:8050 --clients 32 --duration 20
+
+YEARS = ['', '2011', '2012', '2013', '2014']
+SEGMENTS = ['', 'Consumer', 'Corporate', 'Home Office']
+CATEGORIES = ['', 'Furniture', 'Office Supplies', 'Technology']
+
+
+def random_request(rng):
+    endpoint = rng.choice(['monthly', 'countries', 'markets', 'batch'])
+    year = rng.choice(YEARS)
+    if endpoint == 'monthly':
+        query = urllib.parse.urlencode({'year': year, 'segment': rng.choice(SEGMENTS), 'category': rng.choice(CATEGORIES)})
+        return endpoint, '/api/aggregates/monthly?' + query, None
+    if endpoint == 'batch':
+        queries = [{'type': 'monthly', 'year': y or None} for y in YEARS] + [{'type': 'markets', 'year': year or None}]
+        return endpoint, '/api/aggregates/batch', json.dumps({'queries': queries}).encode()
+    return endpoint, '/api/aggregates/{}?year={}'.format(endpoint, year), None
+
+
+def client(url, deadline, seed, etags, results):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        endpoint, path, body = random_request(rng)
+        req = urllib.request.Request(url + path, data=body, headers={'Accept-Encoding': 'gzip'})
+        if body is not None:
+            req.add_header('Content-Type', 'application/json')
+        elif path in etags:
+            req.add_header('If-None-Match', etags[path])
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as response:
+                data = response.read()
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                json.loads(data)
+                if response.headers.get('ETag'):
+                    etags[path] = response.headers['ETag']
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        results.append((endpoint, status, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8050')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    results, etags = [], {}
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=client, args=(args.url, deadline, seed, etags, results))
+               for seed in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print('{} clients, {:.0f}s, {:,} requests, {:.0f} requests/s'.format(
+        args.clients, args.duration, len(results), len(results) / args.duration))
+    print('{:<10} {:>9} {:>7} {:>7} {:>9} {:>9}'.format('endpoint', 'requests', '304', 'errors', 'p50 ms', 'p99 ms'))
+    for endpoint in ['monthly', 'countries', 'markets', 'batch']:
+        rows = [(status, latency) for name, status, latency in results if name == endpoint]
+        if not rows:
+            continue
+        latencies = np.array([latency for _, latency in rows]) * 1000
+        print('{:<10} {:>9,} {:>7,} {:>7,} {:>9.2f} {:>9.2f}'.format(
+            endpoint, len(rows), sum(status == 304 for status, _ in rows),
+            sum(status >= 400 for status, _ in rows), np.percentile(latencies, 50), np.percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
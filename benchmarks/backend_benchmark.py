@@ -0,0 +1,94 @@
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cube import MEASURES  # noqa: E402
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Compare the backends of the store on the same queries: the monthly data and the segment/category totals for every
+# combination of the filters and the map data of every year. The queries are cold (no selection kept by the store),
+# the results of every backend are checked against the pandas backend.
+# python benchmarks/backend_benchmark.py --rows 5000000 --backends pandas sqlite duckdb
+
+
+def load(csv_path, backend):
+    if backend == 'pandas':
+        from dataset import load_store
+        store = load_store(csv_path, shared=False)
+        store.prepare()
+        return store
+    from database import load_database_store
+    return load_database_store(csv_path, backend)
+
+
+def get_queries(store):
+    years = [None] + sorted(store.values('order_year'))
+    segments = [None] + sorted(store.values('Segment'))
+    categories = [None] + sorted(store.values('Category'))
+    filters = list(itertools.product(years, segments, categories))
+    return {
+        'monthly': [(store.monthly, f) for f in filters],
+        'by Segment': [(store.by, ('Segment',) + f) for f in filters],
+        'by Category': [(store.by, ('Category',) + f) for f in filters],
+        'map_data': [(store.map_data, (year,)) for year in years],
+    }
+
+
+def same_result(result, expected):
+    if 'Country' in expected:
+        columns = [column for column in expected.columns if column not in ('Country', 'Market', 'iso_alpha')]
+        return list(result['Country'].astype(str)) == list(expected['Country'].astype(str)) and \
+            np.allclose(result[columns].to_numpy(dtype=float), expected[columns].to_numpy(dtype=float))
+    return np.allclose(result[MEASURES].to_numpy(), expected[MEASURES].to_numpy())
+
+
+def run(csv_path, backends):
+    expected = {}
+    for backend in backends:
+        start = time.perf_counter()
+        store = load(csv_path, backend)
+        print('\n{}: loaded in {:.2f}s'.format(backend, time.perf_counter() - start))
+        print('{:<12} {:>8} {:>9} {:>9} {:>10}  {}'.format('query', 'queries', 'p50 ms', 'max ms', 'total s', 'result'))
+
+        for name, queries in get_queries(store).items():
+            latencies, results = [], []
+            for function, args in queries:
+                store.clear_selections()
+                start = time.perf_counter()
+                results.append(function(*args))
+                latencies.append(time.perf_counter() - start)
+
+            if name not in expected:
+                expected[name], check = results, 'reference'
+            else:
+                same = all(same_result(r, e) for r, e in zip(results, expected[name]))
+                check = 'same' if same else 'DIFFERENT'
+            latencies = np.array(latencies)
+            print('{:<12} {:>8} {:>9.2f} {:>9.2f} {:>10.2f}  {}'.format(
+                name, len(queries), np.percentile(latencies, 50) * 1000, latencies.max() * 1000, latencies.sum(), check))
+        del store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--backends', nargs='+', default=['pandas', 'sqlite'])
+    parser.add_argument('--csv', help='dataset to query instead of a synthetic one')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    folder = tempfile.mkdtemp()
+    try:
+        run(args.csv or write_dataset(args.rows, os.path.join(folder, 'data.csv')), args.backends)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
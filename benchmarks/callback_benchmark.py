@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import profiling  # noqa: E402
+from data_cache import add_date_parts  # noqa: E402
+from dataset import DataStore  # noqa: E402
+from precompute import precompute_aggregates  # noqa: E402
+from synthetic import make_dataset, write_dataset  # noqa: E402
+from timeseries import date_range  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Latency of the callbacks of the dashboard on synthetic datasets, for every combination of the filters.
+# Every call is cold (no figure cache, no aggregates of the selections kept by the store), the time is split
+# between the pandas stage (aggregates) and the plotly stage (figures and their JSON) with the hooks of profiling.py,
+# the peak memory of a call is measured in a second pass with tracemalloc.
+# The median latency is compared with the baseline file, the benchmark fails when a callback is slower than
+# baseline * (1 + --tolerance) + --min-ms.
+# python benchmarks/callback_benchmark.py --rows 100000 1000000 10000000 50000000
+# python benchmarks/callback_benchmark.py --rows 100000 1000000 --save-baseline
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'callback_baseline.json')
+
+
+# the app is started on a small dataset, the synthetic stores are swapped in afterwards
+def start_app(folder):
+    os.makedirs(os.path.join(folder, 'Data'))
+    write_dataset(1000, os.path.join(folder, 'Data', 'data_complete_with_iso.csv'))
+    os.chdir(folder)
+    import app
+    app.startup.wait()
+    return app
+
+
+def make_store(rows):
+    data = add_date_parts(make_dataset(rows))
+    cube, country_totals = precompute_aggregates(data)
+    store = DataStore(data, cube, country_totals=country_totals)
+    store.prepare()
+    return store
+
+
+# the calls of every callback for all the combinations of the filters
+# (update_graph without the KPI button of the callback context, for every measure; the time series of all the days
+# for every granularity, without and with a rolling window and the year before; the compact map sent whole;
+# the cities of every country)
+def get_calls(app, store):
+    years = [None] + [int(year) for year in store.cube['years']]
+    segments = [None] + list(store.cube['segments'])
+    categories = [None] + list(store.cube['categories'])
+    filters = list(itertools.product(years, segments, categories))
+    first_day, last_day = [day.date().isoformat() for day in date_range(store.daily)]
+
+    return {
+        'update_graph': [(app.get_performance_graph, (segment, category, year) + app.KPI_BUTTONS[button])
+                         for year, segment, category in filters for button in app.KPI_BUTTONS],
+        'update_kpi': [(app.update_kpi, (year, segment, category)) for year, segment, category in filters],
+        'update_pies': [(app.update_pies, (year, segment, category)) for year, segment, category in filters],
+        'update_graph_screen2': [(app.update_graph_screen2, (year,)) for year in years],
+        'update_monthly_store': [(app.update_monthly_store, (segment, category, year))
+                                 for year, segment, category in filters],
+        'update_timeseries': [(app.update_timeseries, (first_day, last_day, granularity, window, yoy, 'Sales',
+                                                       segment, category))
+                              for granularity in app.TIMESERIES_GRANULARITIES
+                              for window, yoy in [(None, []), (app.ROLLING_WINDOWS[0], ['yoy'])]
+                              for segment, category in itertools.product(segments, categories)],
+        'update_top_tables': [(app.update_top_tables, (year, segment, category, 'Sales'))
+                              for year, segment, category in filters],
+        'update_compact_map': [(app.update_compact_map, (year, None)) for year in years],
+        'update_cities': [(app.update_cities, ({'points': [{'hovertext': country}]}, year))
+                          for country in store.countries.index for year in years],
+    }
+
+
+def run_callback(app, store, calls):
+    stages = {'pandas': 0.0, 'plotly': 0.0}
+
+    def hook(name, stage, seconds):
+        if stage in stages:
+            stages[stage] += seconds
+
+    wall, pandas_time, plotly_time = [], [], []
+    previous = profiling.set_hook(hook)
+    try:
+        for function, args in calls:
+            app.figure_cache.clear()
+            store.clear_selections()
+            stages.update(pandas=0.0, plotly=0.0)
+            start = time.perf_counter()
+            function(*args)
+            wall.append(time.perf_counter() - start)
+            pandas_time.append(stages['pandas'])
+            plotly_time.append(stages['plotly'])
+    finally:
+        profiling.set_hook(previous)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for function, args in calls:
+            app.figure_cache.clear()
+            store.clear_selections()
+            tracemalloc.reset_peak()
+            function(*args)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+
+    wall = np.array(wall) * 1000
+    return {'calls': len(calls), 'p50': float(np.percentile(wall, 50)), 'p95': float(np.percentile(wall, 95)),
+            'max': float(wall.max()), 'pandas': float(np.mean(pandas_time)) * 1000,
+            'plotly': float(np.mean(plotly_time)) * 1000, 'peak': peak / 2 ** 20}
+
+
+def check(result, baseline, tolerance, min_ms):
+    if baseline is None:
+        return '-', True
+    limit = baseline * (1 + tolerance) + min_ms
+    return '{:.2f}'.format(baseline), result['p50'] <= limit
+
+
+def run(rows_list, baseline_path, tolerance, min_ms, save_baseline):
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baselines = json.load(f)
+
+    folder = tempfile.mkdtemp()
+    failed = False
+    try:
+        app = start_app(folder)
+        # first calls load the plotly templates
+        app.store.clear_selections()
+        app.update_graph_screen2(None)
+        app.get_performance_graph(None, None, None, *app.KPI_BUTTONS['bt_sales'])
+
+        for rows in rows_list:
+            start = time.perf_counter()
+            store = make_store(rows)
+            app.store = store
+            print('\n{:,} rows, {:.1f} MB, setup {:.2f}s'.format(
+                rows, store.data.memory_usage(deep=True).sum() / 2 ** 20, time.perf_counter() - start))
+            print('{:<22} {:>6} {:>8} {:>8} {:>8} {:>10} {:>10} {:>9} {:>9}'.format(
+                'callback', 'calls', 'p50 ms', 'p95 ms', 'max ms', 'pandas ms', 'plotly ms', 'peak MB', 'baseline'))
+
+            baseline = baselines.get(str(rows), {})
+            for name, calls in get_calls(app, store).items():
+                result = run_callback(app, store, calls)
+                baseline_text, ok = check(result, baseline.get(name), tolerance, min_ms)
+                failed |= not ok
+                print('{:<22} {:>6} {:>8.2f} {:>8.2f} {:>8.2f} {:>10.2f} {:>10.2f} {:>9.1f} {:>9} {}'.format(
+                    name, result['calls'], result['p50'], result['p95'], result['max'], result['pandas'],
+                    result['plotly'], result['peak'], baseline_text, '' if ok else 'REGRESSION'))
+                if save_baseline:
+                    baselines.setdefault(str(rows), {})[name] = round(result['p50'], 2)
+
+            app.store = None
+            del store
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print('\nbaseline saved in {}'.format(baseline_path))
+        return True
+    return not failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--min-ms', type=float, default=2.0)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    sys.exit(0 if run(args.rows, args.baseline, args.tolerance, args.min_ms, args.save_baseline) else 1)
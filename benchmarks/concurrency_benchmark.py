@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Throughput of the map callback (update_graph_screen2) with many clients picking a year at the same moment.
+# The app is served by a threaded server on a synthetic dataset. Every round the caches are emptied (like after new
+# orders) and all the clients send their request together, with the years of a few popular choices. It runs
+# without coalescing (every request builds its figure) and with the single-flight of the app (single_flight.py).
+# With SUPERSTORE_BACKGROUND_CALLBACKS=1 the clients poll the results of the background callbacks.
+# python benchmarks/concurrency_benchmark.py --rows 1000000 --clients 50 --rounds 10
+
+OUTPUTS = [('map_Country_Market', 'figure'), ('my_title_map', 'children'), ('Map_Market_Profit', 'figure'),
+           ('my_title_market', 'children')]
+
+
+# previous behavior, every thread computes its own figure
+class NoFlight:
+    coalesced = 0
+
+    def do(self, key, compute):
+        return compute()
+
+    def in_flight(self):
+        return 0
+
+
+def map_request(year):
+    return {'output': '..' + '...'.join('{}.{}'.format(*output) for output in OUTPUTS) + '..',
+            'outputs': [{'id': component, 'property': prop} for component, prop in OUTPUTS],
+            'inputs': [{'id': 'year-slider', 'property': 'value', 'value': year}],
+            'changedPropIds': ['year-slider.value']}
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read() or b'{}')
+
+
+def call_map(url, year):
+    body = map_request(year)
+    result = post(url + '/_dash-update-component', body)
+    # background callback: poll the job until its result is ready
+    while 'response' not in result:
+        time.sleep(0.05)
+        result = post(url + '/_dash-update-component?cacheKey={}&job={}'.format(result['cacheKey'],
+                                                                                 result.get('job', '')), body)
+    return result
+
+
+def run_round(url, years, clients, rng, latencies):
+    barrier = threading.Barrier(clients)
+    choices = [rng.choice(years) for _ in range(clients)]
+
+    def client(year):
+        barrier.wait()
+        start = time.perf_counter()
+        call_map(url, year)
+        latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(year,)) for year in choices]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run(rows, clients, rounds, popular):
+    folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(folder, 'Data'))
+        write_dataset(rows, os.path.join(folder, 'Data', 'data_complete_with_iso.csv'))
+        os.chdir(folder)
+        import app
+        from single_flight import SingleFlight
+        from werkzeug.serving import make_server
+        app.startup.wait()
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app.server, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+        years = ([None] + [int(year) for year in app.store.cube['years']])[:popular]
+        call_map(url, None)
+
+        print('{:,} rows, {} clients, {} rounds, years {}'.format(rows, clients, rounds, years))
+        print('{:<20} {:>10} {:>9} {:>9} {:>8} {:>10}'.format('', 'requests/s', 'p50 ms', 'p99 ms', 'built', 'coalesced'))
+        for name, flights in [('without coalescing', NoFlight), ('single-flight', SingleFlight)]:
+            app.figure_cache._flights, app.store._flights = flights(), flights()
+            misses, latencies, seconds = app.figure_cache.misses, [], 0
+            for round_number in range(rounds):
+                app.figure_cache.clear()
+                app.store.clear_selections()
+                seconds += run_round(url, years, clients, random.Random(round_number), latencies)
+
+            coalesced = app.figure_cache._flights.coalesced
+            latencies = np.array(latencies) * 1000
+            print('{:<20} {:>10.1f} {:>9.1f} {:>9.1f} {:>8} {:>10}'.format(
+                name, len(latencies) / seconds, np.percentile(latencies, 50), np.percentile(latencies, 99),
+                app.figure_cache.misses - misses - coalesced, coalesced))
+        server.shutdown()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--popular', type=int, default=3, help='number of years picked by the clients')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    run(args.rows, args.clients, args.rounds, args.popular)
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iso_resolver import ISO_TABLE_PATH, CountryResolver  # noqa: E402
+from synthetic import COUNTRIES  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Time of the iso_alpha codes of a column of countries with the resolver and with the matching of the notebook
+# (every country against every ISO name with startswith), with the codes of the synthetic countries.
+# python benchmarks/iso_benchmark.py --rows 1000000 10000000
+
+
+# previous matching of Notebooks/iso_apha_webscraping.ipynb, the last ISO name which starts with the country
+def legacy_resolve(countries, table):
+    iso_codes = {}
+    for country in countries.unique():
+        for name, iso_alpha in zip(table['name'], table['iso_alpha']):
+            if name.lower().startswith(country.lower()):
+                iso_codes[country] = iso_alpha
+    return countries.map(iso_codes)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    table = pd.read_csv(ISO_TABLE_PATH, keep_default_na=False, na_values=[''])
+    names = [country for country, _, _ in COUNTRIES]
+    expected = dict((country, iso_alpha) for country, _, iso_alpha in COUNTRIES)
+
+    for rows in args.rows:
+        countries = pd.Series(np.array(names, dtype=object)[np.random.default_rng(0).integers(0, len(names), rows)])
+        resolved, seconds = timed(CountryResolver(table).resolve_column, countries)
+        legacy, legacy_seconds = timed(legacy_resolve, countries, table)
+        print('{:>12,} rows  resolver={:>7.3f}s  legacy={:>7.3f}s  resolver codes {}  legacy codes {}'.format(
+            rows, seconds, legacy_seconds,
+            'ok' if resolved.equals(countries.map(expected).rename('iso_alpha')) else 'DIFFERENT',
+            'ok' if legacy.equals(countries.map(expected)) else 'DIFFERENT'))
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_data import Create_DataFrame_For_Map, get_country_orders, get_country_table, get_market_order  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Compare the data of the map built with the country dimension table and with the previous path
+# (python loop over the groups of every country).
+# python benchmarks/map_benchmark.py --rows 1000000 10000000
+
+
+# previous version of get_iso_market
+def legacy_get_iso_market(df):
+    country_iso_Market = pd.DataFrame(df.loc[:, ['Country', 'Market', 'iso_alpha']].groupby("Country"),
+                                      columns=["Country", "Market"])
+    iso_alpha = []
+    for index in range(country_iso_Market.shape[0]):
+        Market_name = list(country_iso_Market.Market[index]['Market'].unique())[0]
+        iso = list(country_iso_Market.Market[index]['iso_alpha'].unique())[0]
+        iso_alpha.append(iso)
+        country_iso_Market.Market[index] = Market_name
+    country_iso_Market['iso_alpha'] = iso_alpha
+    return country_iso_Market
+
+
+# previous version of Create_DataFrame_For_Map
+def legacy_create_dataframe_for_map(df):
+    country_order = get_country_orders(df)
+    country_iso = legacy_get_iso_market(df)
+    market_order = get_market_order(df)
+
+    data1 = country_iso.join(country_order, how='inner', on='Country')
+    return data1.merge(market_order, how="left", on="Market")
+
+
+def as_object(df):
+    return df.astype({column: object for column in df.columns if df[column].dtype.kind not in 'iuf'})
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def run(rows, repeat):
+    df = make_dataset(rows)
+    df['order_year'] = df['Order Date'].dt.year
+    countries = get_country_table(df)
+
+    for label, year_data in (('all years', df), ('one year', df[df['order_year'] == 2013])):
+        legacy_time, legacy = best_time(lambda: legacy_create_dataframe_for_map(year_data), repeat)
+        new_time, new = best_time(lambda: Create_DataFrame_For_Map(year_data, countries), repeat)
+
+        pd.testing.assert_frame_equal(as_object(new), as_object(legacy[new.columns]), check_dtype=False)
+        print('{:>12,} rows {:<10} legacy={:8.3f}s  dimension table={:8.3f}s  speedup={:5.1f}x'.format(
+            rows, label, legacy_time, new_time, legacy_time / new_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    for rows in args.rows:
+        run(rows, args.repeat)
@@ -0,0 +1,70 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Bytes sent to the browser for the map when the year changes: the whole figure (default mode) and the Patch of the
+# compact mode (SUPERSTORE_COMPACT_MAP=1, see compact_map.py), raw and gzip, with the time of the callbacks.
+# The base figure of the compact mode is only sent once, its size is printed first.
+# python benchmarks/map_payload_benchmark.py --rows 1000000
+
+
+def get_bytes(figure):
+    import plotly
+    if hasattr(figure, 'to_plotly_json'):
+        figure = figure.to_plotly_json()
+    payload = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder).encode()
+    return len(payload), len(gzip.compress(payload))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run(rows):
+    folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(folder, 'Data'))
+        write_dataset(rows, os.path.join(folder, 'Data', 'data_complete_with_iso.csv'))
+        os.chdir(folder)
+        import app
+        app.startup.wait()
+
+        base, _, _, _, key = app.update_compact_map(None, None)
+        print('compact base figure: {:,} bytes, {:,} gzip'.format(*get_bytes(base)))
+        print('{:>6} {:>12} {:>10} {:>9} {:>12} {:>10} {:>9}'.format(
+            'year', 'full bytes', 'gzip', 'ms', 'patch bytes', 'gzip', 'ms'))
+
+        for year in [None] + [int(year) for year in app.store.cube['years']]:
+            app.figure_cache.clear()
+            app.store.clear_selections()
+            (full, *_), full_ms = timed(app.update_graph_screen2, year)
+            app.store.clear_selections()
+            (patch, *_), patch_ms = timed(app.update_compact_map, year, key)
+            print('{!s:>6} {:>12,} {:>10,} {:>9.1f} {:>12,} {:>10,} {:>9.1f}'.format(
+                year, *get_bytes(full), full_ms, *get_bytes(patch), patch_ms))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    run(args.rows)
@@ -0,0 +1,83 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Compare the memory of N worker processes that load the dataset privately and in the shared memory mode.
+# RSS counts the shared pages in every worker, PSS divides them between the workers that map them,
+# so the sum of the PSS is the real memory used by all the workers.
+# python benchmarks/memory_benchmark.py --rows 2000000 --workers 16
+
+
+def read_memory():
+    memory = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                memory[parts[0][:-1]] = int(parts[1]) / 1024
+    return memory
+
+
+def worker(csv_path, shared, barrier, results):
+    from dataset import load_dataset
+    from cube import cube_totals
+
+    data, cube, _ = load_dataset(csv_path, shared=shared)
+    # touch every column like the callbacks would do
+    for column in data.columns:
+        values = data[column]
+        if hasattr(values, 'cat'):
+            values.cat.codes.sum()
+        elif values.dtype.kind in 'iufM':
+            values.to_numpy().view('i8' if values.dtype.kind == 'M' else values.dtype).sum()
+    cube_totals(cube)
+
+    # measure when all the workers are alive, so the shared pages are counted once
+    barrier.wait()
+    results.put(read_memory())
+    barrier.wait()
+
+
+def run(csv_path, shared, workers):
+    from dataset import prepare_dataset
+    if shared:
+        prepare_dataset(csv_path)
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(csv_path, shared, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    memory = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    rss = sum(m['Rss'] for m in memory)
+    pss = sum(m['Pss'] for m in memory)
+    print('{:<8} workers={:<3} RSS/worker={:>9.1f} MB  PSS/worker={:>9.1f} MB  total PSS={:>9.1f} MB'.format(
+        'shared' if shared else 'private', workers, rss / workers, pss / workers, pss))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--csv', help='dataset to load instead of a synthetic one')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        csv_path = args.csv or write_dataset(args.rows, os.path.join(folder, 'data.csv'))
+        run(csv_path, False, args.workers)
+        run(csv_path, True, args.workers)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
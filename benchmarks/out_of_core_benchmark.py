@@ -0,0 +1,71 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Peak memory (VmHWM of a new process) of loading the dataset in memory and of building the aggregates in the
+# out-of-core mode with several memory budgets, with the totals of both to check that they are the same.
+# python benchmarks/out_of_core_benchmark.py --rows 5000000 --budgets 64 256
+
+
+# peak resident memory of the process (ru_maxrss would also count the parent before the exec)
+def read_peak_memory():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+
+def load(csv_path, budget_mb, results):
+    warnings.simplefilter('ignore')
+    from cube import cube_totals
+
+    start = time.perf_counter()
+    if budget_mb is None:
+        from dataset import load_store
+        store = load_store(csv_path, shared=False)
+    else:
+        from out_of_core import load_chunked_store
+        store = load_chunked_store(csv_path, budget_mb=budget_mb)
+    seconds = time.perf_counter() - start
+
+    totals = cube_totals(store.cube)
+    orders = store.map_data()['OrderCount_Per_Country'].sum()
+    results.put((seconds, read_peak_memory(), totals['Sales'], orders))
+
+
+def run(csv_path, budget_mb):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=load, args=(csv_path, budget_mb, results))
+    process.start()
+    seconds, peak, sales, orders = results.get()
+    process.join()
+    print('{:<22} {:>8.2f}s  peak RSS={:>9.1f} MB  sales={:,.2f}  orders={:,}'.format(
+        'in memory' if budget_mb is None else 'out-of-core {} MB'.format(budget_mb), seconds, peak, sales, orders))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--budgets', type=int, nargs='+', default=[32, 128, 512])
+    parser.add_argument('--csv', help='dataset to load instead of a synthetic one')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        csv_path = args.csv or write_dataset(args.rows, os.path.join(folder, 'data.csv'))
+        print('{}: {:.1f} MB'.format(csv_path, os.path.getsize(csv_path) / 2 ** 20))
+        for budget_mb in [None] + args.budgets:
+            run(csv_path, budget_mb)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cache import add_date_parts  # noqa: E402
+from precompute import PARTITION_ROWS, precompute_aggregates  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Time of the precompute of the aggregates (cube and totals of the countries) with 1, 2, 4... workers,
+# the aggregates of every pool must be the same as the serial ones (1 worker).
+# python benchmarks/precompute_benchmark.py --rows 10000000 --workers 1 2 4 8
+
+
+def same_aggregates(left, right):
+    (left_cube, left_totals), (right_cube, right_totals) = left, right
+    return all(np.array_equal(left_cube[key], right_cube[key]) for key in left_cube) and left_totals.equals(right_totals)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--partition-rows', type=int, default=PARTITION_ROWS)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    data = add_date_parts(make_dataset(args.rows))
+    print('{:,} rows, {} cores, partitions of {:,} rows'.format(args.rows, os.cpu_count(), args.partition_rows))
+
+    serial = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        aggregates = precompute_aggregates(data, workers=workers, partition_rows=args.partition_rows)
+        seconds = time.perf_counter() - start
+        if serial is None:
+            serial, serial_seconds = aggregates, seconds
+        print('workers={:<3} {:>8.2f}s  speedup={:>5.2f}  {}'.format(
+            workers, seconds, serial_seconds / seconds, 'same' if same_aggregates(aggregates, serial) else 'DIFFERENT'))
@@ -0,0 +1,94 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Synthetic dataset with the same columns as Data/data_complete_with_iso.csv, used by the benchmarks.
+# python benchmarks/synthetic.py 1000000 Data/synthetic.csv
+
+COUNTRIES = [
+    ('United States', 'US', 'USA'), ('Canada', 'Canada', 'CAN'), ('Mexico', 'LATAM', 'MEX'),
+    ('Brazil', 'LATAM', 'BRA'), ('Argentina', 'LATAM', 'ARG'), ('France', 'EU', 'FRA'),
+    ('Germany', 'EU', 'DEU'), ('United Kingdom', 'EU', 'GBR'), ('Italy', 'EU', 'ITA'),
+    ('Spain', 'EU', 'ESP'), ('China', 'APAC', 'CHN'), ('India', 'APAC', 'IND'),
+    ('Australia', 'APAC', 'AUS'), ('Japan', 'APAC', 'JPN'), ('Indonesia', 'APAC', 'IDN'),
+    ('Nigeria', 'Africa', 'NGA'), ('Egypt', 'Africa', 'EGY'), ('South Africa', 'Africa', 'ZAF'),
+    ('Turkey', 'EMEA', 'TUR'), ('Iran', 'EMEA', 'IRN'), ('Saudi Arabia', 'EMEA', 'SAU'),
+]
+SEGMENTS = ['Consumer', 'Corporate', 'Home Office']
+SUB_CATEGORIES = {
+    'Furniture': ['Bookcases', 'Chairs', 'Furnishings', 'Tables'],
+    'Office Supplies': ['Appliances', 'Art', 'Binders', 'Envelopes', 'Fasteners', 'Labels', 'Paper',
+                        'Storage', 'Supplies'],
+    'Technology': ['Accessories', 'Copiers', 'Machines', 'Phones'],
+}
+SHIP_MODES = ['First Class', 'Same Day', 'Second Class', 'Standard Class']
+PRIORITIES = ['Critical', 'High', 'Low', 'Medium']
+
+
+# text column from integer codes, categorical like the columns loaded from the cache
+def labels(codes, values):
+    return pd.Categorical.from_codes(codes, categories=values)
+
+
+def numbered(codes, pattern, count):
+    return labels(codes, [pattern.format(i) for i in range(count)])
+
+
+def make_dataset(rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    country = rng.integers(0, len(COUNTRIES), rows)
+    markets = sorted(set(c[1] for c in COUNTRIES))
+    market = np.searchsorted(markets, np.array([c[1] for c in COUNTRIES]))[country]
+
+    sub_categories = [s for c in SUB_CATEGORIES for s in SUB_CATEGORIES[c]]
+    sub_category_of = np.repeat(np.arange(len(SUB_CATEGORIES)), [len(s) for s in SUB_CATEGORIES.values()])
+    sub_category = rng.integers(0, len(sub_categories), rows)
+    product = rng.integers(0, 10000, rows)
+    orders = max(rows // 2, 1)
+
+    order_date = np.datetime64('2011-01-01') + rng.integers(0, 4 * 365, rows).astype('timedelta64[D]')
+    ship_date = order_date + rng.integers(0, 8, rows).astype('timedelta64[D]')
+    city = country * 100 + rng.integers(0, 100, rows)
+
+    return pd.DataFrame({
+        'Row ID': np.arange(1, rows + 1),
+        'Order ID': numbered(rng.integers(0, orders, rows), 'ORD-{:08d}', orders),
+        'Order Date': pd.to_datetime(order_date),
+        'Ship Date': pd.to_datetime(ship_date),
+        'Ship Mode': labels(rng.integers(0, len(SHIP_MODES), rows), SHIP_MODES),
+        'Customer ID': numbered(rng.integers(0, 5000, rows), 'CU-{:05d}', 5000),
+        'Customer Name': numbered(rng.integers(0, 5000, rows), 'Customer {}', 5000),
+        'Segment': labels(rng.integers(0, len(SEGMENTS), rows), SEGMENTS),
+        'City': numbered(city, 'City {}', len(COUNTRIES) * 100),
+        'State': numbered(city // 10, 'State {}', len(COUNTRIES) * 10),
+        'Country': labels(country, [c[0] for c in COUNTRIES]),
+        'Postal Code': np.where(country == 0, rng.integers(10000, 99999, rows), np.nan),
+        'Market': labels(market, markets),
+        'Region': labels(market, markets),
+        'Product ID': numbered(product, 'PR-{:05d}', 10000),
+        'Category': labels(sub_category_of[sub_category], list(SUB_CATEGORIES)),
+        'Sub-Category': labels(sub_category, sub_categories),
+        'Product Name': numbered(product, 'Product {}', 10000),
+        'Sales': np.round(rng.gamma(1.5, 160, rows), 2),
+        'Quantity': rng.integers(1, 15, rows),
+        'Discount': rng.choice([0, 0.1, 0.2, 0.4, 0.5], rows),
+        'Profit': np.round(rng.normal(25, 120, rows), 4),
+        'Shipping Cost': np.round(rng.gamma(1.2, 20, rows), 2),
+        'Order Priority': labels(rng.integers(0, len(PRIORITIES), rows), PRIORITIES),
+        'iso_alpha': labels(country, [c[2] for c in COUNTRIES]),
+    })
+
+
+def write_dataset(rows, csv_path, seed=0):
+    df = make_dataset(rows, seed)
+    df['Order Date'] = df['Order Date'].dt.strftime('%Y-%m-%d')
+    df['Ship Date'] = df['Ship Date'].dt.strftime('%d-%m-%Y')
+    df.to_csv(csv_path, index=False)
+    return csv_path
+
+
+if __name__ == '__main__':
+    write_dataset(int(sys.argv[1]), sys.argv[2])
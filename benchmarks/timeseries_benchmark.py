@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cube import MEASURES  # noqa: E402
+from data_cache import add_date_parts  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+from timeseries import GRANULARITIES, build_daily, get_time_series  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Time of the time series of random date ranges, granularities and filters from the prefix sums of the days and
+# with a filter + groupby of the orders, with the results of both of them compared.
+# python benchmarks/timeseries_benchmark.py --rows 1000000 10000000 --queries 50
+
+
+def groupby_series(data, start, end, granularity, segment, category):
+    selected = (data['Order Date'] >= start) & (data['Order Date'] < end + pd.Timedelta(days=1))
+    if segment is not None:
+        selected &= data['Segment'] == segment
+    if category is not None:
+        selected &= data['Category'] == category
+    rows = data[selected]
+    freq = GRANULARITIES[granularity]
+    series = rows.groupby(rows['Order Date'].dt.to_period(freq))[MEASURES].sum()
+    return series.reindex(pd.period_range(start, end, freq=freq), fill_value=0)
+
+
+def get_queries(data, count, seed=0):
+    rng = np.random.default_rng(seed)
+    first_day, last_day = data['Order Date'].min(), data['Order Date'].max()
+    days = (last_day - first_day).days
+    segments, categories = [None] + sorted(data['Segment'].unique()), [None] + sorted(data['Category'].unique())
+    for _ in range(count):
+        start = first_day + pd.Timedelta(days=int(rng.integers(0, days)))
+        end = start + pd.Timedelta(days=int(rng.integers(0, days)))
+        yield (start.normalize(), min(end, last_day).normalize(), rng.choice(['day', 'week', 'month', 'quarter']),
+               segments[rng.integers(len(segments))], categories[rng.integers(len(categories))])
+
+
+def run(rows, count):
+    data = add_date_parts(make_dataset(rows))
+    start = time.perf_counter()
+    daily = build_daily(data)
+    print('\n{:,} rows: prefix sums of {} days built in {:.2f}s ({:.1f} MB)'.format(
+        rows, len(daily['prefix']) - 1, time.perf_counter() - start, daily['prefix'].nbytes / 2 ** 20))
+
+    prefix_times, groupby_times, same = [], [], True
+    for query in get_queries(data, count):
+        start = time.perf_counter()
+        series = get_time_series(daily, *query, window=30, yoy=True)
+        prefix_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        expected = groupby_series(data, *query)
+        groupby_times.append(time.perf_counter() - start)
+        same &= np.allclose(series[MEASURES].to_numpy(), expected.to_numpy())
+
+    print('prefix sums (with rolling and yoy) p50={:.2f} ms   groupby p50={:.2f} ms   {}'.format(
+        np.percentile(prefix_times, 50) * 1000, np.percentile(groupby_times, 50) * 1000,
+        'same' if same else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    for rows in args.rows:
+        run(rows, args.queries)
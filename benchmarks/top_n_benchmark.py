@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_cache import add_date_parts  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+from top_n import TOP_DIMENSIONS, TOP_N, precompute_rankings, top_items  # noqa: E402
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Time of the top-N tables (sub-categories, cities, products) for random filters: from the rankings with
+# np.argpartition, from the same rankings with a full sort of the items, and with a filter + groupby + sort of the
+# orders. The measures of the N items must be the same for the three of them.
+# python benchmarks/top_n_benchmark.py --rows 1000000 10000000 --queries 50
+
+
+def groupby_top(data, dimension, year, segment, category, n, measure):
+    selected = np.ones(len(data), dtype=bool)
+    for column, value in [('order_year', year), ('Segment', segment), ('Category', category)]:
+        if value is not None:
+            selected &= (data[column] == value).to_numpy()
+    rows = data[selected]
+    return rows.groupby(dimension, observed=True)[measure].sum().sort_values(ascending=False).iloc[:n].to_numpy()
+
+
+def sorted_top(rankings, dimension, year, segment, category, n, measure):
+    totals = top_items(rankings, dimension, year, segment, category, n=len(rankings[dimension + '.items']),
+                       measure=measure)
+    return totals[measure].to_numpy()[:n]
+
+
+def get_queries(data, count, seed=0):
+    rng = np.random.default_rng(seed)
+    years = [None] + sorted(data['order_year'].unique())
+    segments, categories = [None] + sorted(data['Segment'].unique()), [None] + sorted(data['Category'].unique())
+    for _ in range(count):
+        yield (TOP_DIMENSIONS[rng.integers(len(TOP_DIMENSIONS))], years[rng.integers(len(years))],
+               segments[rng.integers(len(segments))], categories[rng.integers(len(categories))],
+               ['Sales', 'Profit', 'Quantity'][rng.integers(3)])
+
+
+def timed(times, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    times.append(time.perf_counter() - start)
+    return result
+
+
+def run(rows, count, n):
+    data = add_date_parts(make_dataset(rows))
+    start = time.perf_counter()
+    rankings = precompute_rankings(data)
+    size = sum(rankings[dimension + '.values'].nbytes for dimension in TOP_DIMENSIONS)
+    print('\n{:,} rows: rankings built in {:.2f}s ({:.1f} MB, {})'.format(
+        rows, time.perf_counter() - start, size / 2 ** 20,
+        ', '.join('{:,} {}'.format(len(rankings[dimension + '.items']), dimension) for dimension in TOP_DIMENSIONS)))
+
+    times = {'argpartition': [], 'full sort': [], 'groupby': []}
+    same = True
+    for dimension, year, segment, category, measure in get_queries(data, count):
+        args = (dimension, year, segment, category, n, measure)
+        top = timed(times['argpartition'], top_items, rankings, *args)[measure].to_numpy()
+        full = timed(times['full sort'], sorted_top, rankings, *args)
+        expected = timed(times['groupby'], groupby_top, data, *args)
+        same &= np.allclose(top, full) and np.allclose(top, expected)
+
+    for name, seconds in times.items():
+        print('{:<14} p50={:>9.2f} ms   p99={:>9.2f} ms'.format(
+            name, np.percentile(seconds, 50) * 1000, np.percentile(seconds, 99) * 1000))
+    print('top {} of {} queries {}'.format(n, count, 'same' if same else 'DIFFERENT'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=30)
+    parser.add_argument('--n', type=int, default=TOP_N)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    for rows in args.rows:
+        run(rows, args.queries, args.n)
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Index of the rows of the dataset for every value of the filter columns.
+# The columns with few values keep one bitmap per value (1 bit per row, np.packbits), the countries keep the
+# row ids (int32) sorted by country with the offset of every country. Only the drill-down of the cities filters the
+# countries, their row ids are added to the index the first time it's used (add_row_ids).
+# Combining filters is an AND of the bitmaps, no string is compared. The values are kept in the order they appear
+# in the dataset, like unique() does.
+# The rows of new orders are added to the index (append_index), it's not built again.
+
+BITMAP_COLUMNS = ['order_year', 'Segment', 'Category', 'Market']
+ROW_ID_COLUMNS = ['Country']
+
+
+# integer code of every row and the values of the codes, in order of appearance
+def get_codes(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.to_numpy(), values.cat.categories.to_numpy()
+    else:
+        codes, labels = pd.factorize(values)
+
+    present, first_row = np.unique(codes[codes >= 0], return_index=True)
+    appearance = present[np.argsort(first_row)]
+    # renumber the codes in order of appearance, the values which are not in the rows are dropped
+    recode = np.full(len(labels) + 1, -1, dtype=np.int32)
+    recode[appearance] = np.arange(len(appearance))
+    return recode[codes], np.asarray(labels)[appearance]
+
+
+def build_index(data):
+    index = {'rows': np.array([len(data)])}
+    for column in BITMAP_COLUMNS:
+        codes, labels = get_codes(data[column])
+        index[column + '.values'] = labels
+        index[column + '.bitmaps'] = np.stack([np.packbits(codes == code) for code in range(len(labels))]) \
+            if len(labels) else np.zeros((0, (len(data) + 7) // 8), dtype=np.uint8)
+    return index
+
+
+def has_row_ids(index):
+    return all(column + '.rows' in index for column in ROW_ID_COLUMNS)
+
+
+# the index with the row ids of the countries, data has the rows of the index (the row id columns at least)
+def add_row_ids(index, data):
+    index = dict(index)
+    for column in ROW_ID_COLUMNS:
+        codes, labels = get_codes(data[column])
+        order = np.argsort(codes, kind='stable')
+        index[column + '.values'] = labels
+        index[column + '.rows'] = order.astype(np.int32)
+        index[column + '.offsets'] = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+    return index
+
+
+# codes of the values in the labels of the index, the new values are added after them in order of appearance
+def get_appended_codes(labels, values):
+    codes, values_labels = get_codes(values)
+    positions = {label: position for position, label in enumerate(labels)}
+    added = [label for label in values_labels if label not in positions]
+    if added:
+        labels = np.concatenate([labels, np.array(added, dtype=labels.dtype)])
+        positions.update((label, position) for position, label in enumerate(labels))
+    # the missing values keep the code -1
+    recode = np.array([positions[label] for label in values_labels] + [-1], dtype=np.int32)
+    return recode[codes], labels
+
+
+# the index of the rows followed by the new rows of data, the bitmaps and the row ids are extended, not built again
+def append_index(index, data):
+    rows = int(index['rows'][0])
+    appended = {'rows': np.array([rows + len(data)])}
+    for column in BITMAP_COLUMNS:
+        codes, labels = get_appended_codes(index[column + '.values'], data[column])
+        bitmaps = index[column + '.bitmaps']
+        # the bits of the new rows start in the last byte of the bitmaps when the rows are not a multiple of 8
+        shift = rows % 8
+        extended = []
+        for code in range(len(labels)):
+            bitmap = bitmaps[code] if code < len(bitmaps) else np.zeros(bitmaps.shape[1], dtype=np.uint8)
+            new_bits = np.packbits(np.concatenate([np.zeros(shift, dtype=bool), codes == code]))
+            if shift:
+                new_bits[0] |= bitmap[-1]
+                bitmap = bitmap[:-1]
+            extended.append(np.concatenate([bitmap, new_bits]))
+        appended[column + '.values'] = labels
+        appended[column + '.bitmaps'] = np.stack(extended) if extended \
+            else np.zeros((0, (rows + len(data) + 7) // 8), dtype=np.uint8)
+
+    for column in ROW_ID_COLUMNS if has_row_ids(index) else []:
+        codes, labels = get_appended_codes(index[column + '.values'], data[column])
+        offsets = index[column + '.offsets']
+        offsets = np.concatenate([offsets, np.full(len(labels) + 1 - len(offsets), offsets[-1])])
+        # the new rows go at the end of the rows of their value (the missing values are before the first one)
+        order = np.argsort(codes, kind='stable')
+        row_ids = index[column + '.rows']
+        appended[column + '.values'] = labels
+        appended[column + '.rows'] = np.insert(row_ids, offsets[codes[order] + 1],
+                                               (rows + order).astype(row_ids.dtype))
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+        appended[column + '.offsets'] = offsets + np.count_nonzero(codes < 0) + np.concatenate([[0], np.cumsum(counts)])
+    return appended
+
+
+# values of a column of the index, for the dropdowns
+def index_values(index, column):
+    return list(index[column + '.values'])
+
+
+# bitmap of the rows with the value in the column
+def get_bitmap(index, column, value):
+    rows = int(index['rows'][0])
+    labels = index[column + '.values']
+    position = np.flatnonzero(labels == value)
+    if len(position) == 0:
+        return np.zeros((rows + 7) // 8, dtype=np.uint8)
+    if column + '.bitmaps' in index:
+        return index[column + '.bitmaps'][position[0]]
+
+    offsets = index[column + '.offsets']
+    selected = np.zeros(rows, dtype=bool)
+    selected[index[column + '.rows'][offsets[position[0]]:offsets[position[0] + 1]]] = True
+    return np.packbits(selected)
+
+
+# ids of the rows that match all the filters, e.g. select_rows(index, {'order_year': 2013, 'Segment': 'Consumer'})
+# the filters with a None value are not used
+def select_rows(index, filters):
+    rows = int(index['rows'][0])
+    bitmaps = [get_bitmap(index, column, value) for column, value in filters.items() if value is not None]
+    if not bitmaps:
+        return np.arange(rows)
+    selected = np.bitwise_and.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0]
+    return np.flatnonzero(np.unpackbits(selected, count=rows))
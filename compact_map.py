@@ -0,0 +1,60 @@
+import hashlib
+import os
+
+import numpy as np
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Compact mode of the map (SUPERSTORE_COMPACT_MAP=1).
+# The figure of the map (template, geo layout, one trace per market with all the countries) is sent to the browser
+# once, a change of year only sends a Patch with the numbers of the countries as integers: the size of the markers,
+# the sales and the orders of the countries (customdata) and the ones of the markets (meta) for the hover.
+# The browser keeps the key of its base figure (map_base_key), it gets the whole figure again when the countries
+# changed (new orders from a new country) or when it has no base figure yet.
+# Clicking a country shows the sales of its cities, binned on the server (top cities and the other ones together).
+
+COMPACT_MAP = os.environ.get('SUPERSTORE_COMPACT_MAP', '0') == '1'
+SIZE_MAX = 25
+
+# cities of the drill-down, the other cities of the country are one bin
+CITY_BINS = 10
+
+COMPACT_MAP_HOVER = ('<b>%{hovertext}</b><br><br>Market=%{meta[0]}<br>TotalSales_Per_Country=%{customdata[0]}<br>'
+                     'OrderCount_Per_Country=%{customdata[1]}<br>TotalSales_Per_Market=%{meta[1]}<br>'
+                     'OrderCount_Per_Market=%{meta[2]}<extra></extra>')
+
+
+# same key in all the workers for the same countries
+def get_base_key(countries):
+    return hashlib.sha1(countries.to_csv().encode()).hexdigest()[:16]
+
+
+# the base figure (dict of the plotly JSON) with the countries and the market of every trace
+def get_map_base(figure, countries):
+    return {'key': get_base_key(countries), 'countries': countries, 'figure': figure,
+            'trace_countries': [list(trace['hovertext']) for trace in figure['data']],
+            'trace_markets': [trace['name'] for trace in figure['data']]}
+
+
+# write the numbers of the year in the map, figure is a dash Patch or the dict of the base figure,
+# the countries without orders in the year get a marker of size 0
+def set_map_numbers(figure, base, map_data):
+    countries = map_data.set_index(map_data['Country'].astype(str))
+    markets = map_data.drop_duplicates('Market').set_index(map_data['Market'].drop_duplicates().astype(str))
+    sales = countries['TotalSales_Per_Country'].max() if len(countries) else 0
+    sizeref = max(sales, 1) / SIZE_MAX ** 2
+
+    for position, (names, market) in enumerate(zip(base['trace_countries'], base['trace_markets'])):
+        rows = countries.reindex(names)
+        country_sales = rows['TotalSales_Per_Country'].fillna(0).to_numpy(dtype=np.int64)
+        country_orders = rows['OrderCount_Per_Country'].fillna(0).to_numpy(dtype=np.int64)
+        market_sales, market_orders = 0, 0
+        if market in markets.index:
+            market_sales = int(markets.at[market, 'TotalSales_Per_Market'])
+            market_orders = int(markets.at[market, 'OrderCount_Per_Market'])
+
+        trace = figure['data'][position]
+        trace['marker']['size'] = country_sales.tolist()
+        trace['marker']['sizeref'] = sizeref
+        trace['customdata'] = np.column_stack([country_sales, country_orders]).tolist()
+        trace['meta'] = [market, market_sales, market_orders]
+    return figure
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Pre-aggregated cube of the measures keyed by (order_year, order_month, Segment, Category).
+# It is built once from the dataset, after that every filter combination of the dashboard is answered
+# with a small array lookup, so the callbacks don't depend on the number of order lines.
+# The totals of the months (order_year, Segment, Category) are kept too for the pie charts.
+
+MEASURES = ['Sales', 'Profit', 'Quantity', 'Discount']
+MONTHS = np.arange(1, 13)
+
+
+def build_cube(df):
+    years = np.sort(df['order_year'].unique())
+    segments = np.sort(df['Segment'].unique())
+    categories = np.sort(df['Category'].unique())
+
+    # position of every row on each axis of the cube
+    year_idx = np.searchsorted(years, df['order_year'].to_numpy())
+    month_idx = df['order_month'].to_numpy() - 1
+    segment_idx = np.searchsorted(segments, df['Segment'].to_numpy())
+    category_idx = np.searchsorted(categories, df['Category'].to_numpy())
+
+    shape = (len(years), len(MONTHS), len(segments), len(categories))
+    cell = np.ravel_multi_index((year_idx, month_idx, segment_idx, category_idx), shape)
+
+    values = np.empty(shape + (len(MEASURES),))
+    for m, measure in enumerate(MEASURES):
+        values[..., m] = np.bincount(cell, weights=df[measure].to_numpy(dtype=float),
+                                     minlength=int(np.prod(shape))).reshape(shape)
+
+    return {'years': years, 'segments': segments, 'categories': categories, 'values': values,
+            'totals': values.sum(axis=1)}
+
+
+# get the position of an option on an axis, None means all the values of the axis
+def _axis_index(labels, option):
+    if option is None:
+        return slice(None)
+    position = np.searchsorted(labels, option)
+    if position == len(labels) or labels[position] != option:
+        # unknown value, select nothing
+        return slice(0, 0)
+    return slice(position, position + 1)
+
+
+# get the monthly measures for the selected year, segment and category
+def cube_monthly(cube, year=None, segment=None, category=None):
+    year = None if year is None else int(year)
+    selection = cube['values'][_axis_index(cube['years'], year), :,
+                               _axis_index(cube['segments'], segment),
+                               _axis_index(cube['categories'], category)]
+    monthly = selection.sum(axis=(0, 2, 3))
+
+    monthly_data = pd.DataFrame(monthly, columns=MEASURES)
+    monthly_data.insert(0, 'order_month', MONTHS)
+    return monthly_data
+
+
+# get the total of every measure for the selected year, segment and category
+def cube_totals(cube, year=None, segment=None, category=None):
+    monthly_data = cube_monthly(cube, year, segment, category)
+    return monthly_data[MEASURES].sum()
+
+
+# get the total of every measure per segment (filtered by year and category)
+# or per category (filtered by year and segment)
+@profiled('pandas')
+def cube_by(cube, dimension, year=None, segment=None, category=None):
+    year = None if year is None else int(year)
+    totals = cube['totals'] if 'totals' in cube else cube['values'].sum(axis=1)
+    selection = totals[_axis_index(cube['years'], year)]
+    if dimension == 'Segment':
+        selection = selection[:, :, _axis_index(cube['categories'], category)]
+        labels, totals = cube['segments'], selection.sum(axis=(0, 2))
+    else:
+        selection = selection[:, _axis_index(cube['segments'], segment)]
+        labels, totals = cube['categories'], selection.sum(axis=(0, 1))
+
+    totals_data = pd.DataFrame(totals, columns=MEASURES)
+    totals_data.insert(0, dimension, labels)
+    return totals_data
+
+
+# add two cubes, the labels of the result are the union of the labels of both of them
+def merge_cubes(left, right):
+    years = np.union1d(left['years'], right['years'])
+    segments = np.union1d(left['segments'], right['segments']).astype(object)
+    categories = np.union1d(left['categories'], right['categories']).astype(object)
+
+    values = np.zeros((len(years), len(MONTHS), len(segments), len(categories), len(MEASURES)))
+    for cube in (left, right):
+        position = np.ix_(np.searchsorted(years, cube['years']), np.arange(len(MONTHS)),
+                          np.searchsorted(segments, cube['segments']),
+                          np.searchsorted(categories, cube['categories']))
+        values[position] += cube['values']
+
+    return {'years': years, 'segments': segments, 'categories': categories, 'values': values,
+            'totals': values.sum(axis=1)}
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from iso_resolver import add_iso_codes
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Columnar cache of the dataset CSV.
+# The CSV is parsed once and every column is written as a .npy file next to it (Data/.cache/<name>/):
+# numeric columns as they are, the dates already parsed as datetime64 and the text columns dictionary encoded
+# as integer codes + the list of the distinct values. Loading the cache is only reading binary arrays, and it's
+# rebuilt by itself when the mtime or the content hash of the CSV changes.
+# The arrays can also be opened memory mapped (mmap_mode='r'), then all the processes that load the same cache
+# share one copy of the data in the page cache instead of a private copy each.
+
+CACHE_VERSION = 2
+DATE_COLUMNS = ['Order Date']
+
+# text columns with fewer distinct values than this fraction of the rows are loaded as pandas Categorical
+LOW_CARDINALITY = 0.5
+
+
+def get_cache_dir(csv_path):
+    folder, file_name = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(folder, '.cache', os.path.splitext(file_name)[0])
+
+
+def file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+# get the year and the month of the order date
+def add_date_parts(df):
+    df['order_year'] = df['Order Date'].dt.year
+    df['order_month'] = df['Order Date'].dt.month
+    return df
+
+
+# the iso_alpha codes which are not in the CSV are resolved from the names of the countries (see iso_resolver.py)
+def read_source_csv(csv_path):
+    df = pd.read_csv(csv_path)
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column], infer_datetime_format=True)
+    add_iso_codes(df)
+    return add_date_parts(df)
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# write the cache
+
+def write_cache(df, cache_dir, source_stat):
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+
+    # write in a temporary folder and swap it at the end, so readers never see a half written cache
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        file_name = 'col_{:03d}.npy'.format(position)
+        entry = {'name': column, 'file': file_name}
+
+        if pd.api.types.is_datetime64_any_dtype(values):
+            entry['kind'] = 'datetime'
+            np.save(os.path.join(tmp_dir, file_name), values.to_numpy(dtype='datetime64[ns]'))
+
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            entry['kind'] = 'numeric'
+            np.save(os.path.join(tmp_dir, file_name), values.to_numpy())
+
+        else:
+            # dictionary encoding: codes + sorted distinct values (-1 is the code of the missing values)
+            codes, uniques = pd.factorize(values.astype(object).where(values.notna(), None), sort=True)
+            entry['kind'] = 'dictionary'
+            entry['values_file'] = 'values_{:03d}.npy'.format(position)
+            entry['low_cardinality'] = len(uniques) <= LOW_CARDINALITY * max(len(values), 1)
+            code_type = np.int8 if len(uniques) < 2 ** 7 else np.int16 if len(uniques) < 2 ** 15 else np.int32
+            np.save(os.path.join(tmp_dir, file_name), codes.astype(code_type))
+            np.save(os.path.join(tmp_dir, entry['values_file']), np.asarray(uniques, dtype=str))
+
+        columns.append(entry)
+
+    meta = dict(source_stat, version=CACHE_VERSION, rows=len(df), columns=columns)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    old_dir = None
+    if os.path.isdir(cache_dir):
+        old_dir = cache_dir + '.old-{}'.format(os.getpid())
+        os.replace(cache_dir, old_dir)
+    os.replace(tmp_dir, cache_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# read the cache
+
+def read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def read_cache(cache_dir, meta, mmap_mode=None):
+    columns = {}
+    for entry in meta['columns']:
+        values = np.load(os.path.join(cache_dir, entry['file']), mmap_mode=mmap_mode)
+        if entry['kind'] == 'dictionary':
+            uniques = np.load(os.path.join(cache_dir, entry['values_file'])).astype(object)
+            values = pd.Categorical.from_codes(values, categories=uniques)
+            # memory mapped columns stay as codes, decoding them would make a private copy
+            if not entry['low_cardinality'] and mmap_mode is None:
+                values = np.asarray(values, dtype=object)
+        columns[entry['name']] = values
+    # copy=False keeps the memory mapped arrays as the blocks of the frame
+    return pd.DataFrame(columns, copy=False)
+
+
+# check if the cache was built from the current version of the CSV
+def is_cache_valid(meta, csv_path, stat):
+    if meta is None:
+        return False
+    if meta['mtime'] == stat.st_mtime and meta['size'] == stat.st_size:
+        return True
+    # the file was touched, compare the content before rebuilding
+    return meta['size'] == stat.st_size and meta['sha1'] == file_hash(csv_path)
+
+
+# keep the new mtime of an unchanged CSV, so the hash is not computed again on the next start
+def touch_meta(cache_dir, meta, stat):
+    meta['mtime'] = stat.st_mtime
+    tmp_file = os.path.join(cache_dir, 'meta.json.tmp-{}'.format(os.getpid()))
+    with open(tmp_file, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, os.path.join(cache_dir, 'meta.json'))
+
+
+# only one process builds the cache, the others wait for it and read it
+@contextmanager
+def cache_lock(cache_dir):
+    os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+    with open(cache_dir + '.lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_data(csv_path, mmap_mode=None):
+    start = time.perf_counter()
+    cache_dir = get_cache_dir(csv_path)
+
+    with cache_lock(cache_dir):
+        stat = os.stat(csv_path)
+        meta = read_meta(cache_dir)
+
+        if is_cache_valid(meta, csv_path, stat):
+            source = 'cache'
+            if meta['mtime'] != stat.st_mtime:
+                touch_meta(cache_dir, meta, stat)
+        else:
+            source = 'csv'
+            df = read_source_csv(csv_path)
+            write_cache(df, cache_dir, {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': file_hash(csv_path)})
+            meta = read_meta(cache_dir)
+
+    df = read_cache(cache_dir, meta, mmap_mode=mmap_mode)
+    print('loaded {:,} rows from {} in {:.2f}s'.format(len(df), source, time.perf_counter() - start))
+    return df
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# arrays derived from the dataset (aggregates) are saved in sub folders of the cache,
+# they are removed with the cache when the CSV changes
+
+def write_arrays(folder, arrays):
+    os.makedirs(os.path.dirname(folder), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(folder), prefix='.tmp-')
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(os.path.join(tmp_dir, name + '.npy'), values)
+    try:
+        os.replace(tmp_dir, folder)
+    except OSError:
+        # another process saved the same arrays first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_arrays(folder, mmap_mode=None):
+    if not os.path.isdir(folder):
+        return None
+    arrays = {}
+    for file_name in os.listdir(folder):
+        name, extension = os.path.splitext(file_name)
+        if extension == '.npy':
+            values = np.load(os.path.join(folder, file_name), mmap_mode=mmap_mode)
+            arrays[name] = values.astype(object) if values.dtype.kind == 'U' else values
+    return arrays
@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+
+import pandas as pd
+
+from cube import MEASURES, MONTHS, cube_by, cube_monthly
+from data_cache import cache_lock, get_cache_dir, load_data
+from dataset import DATA_PATH, BaseStore, load_aggregate, load_cached_rows
+from map_data import update_country_table
+from out_of_core import BATCH_DTYPES, ChunkedStore
+from profiling import profiled
+from timeseries import build_daily, merge_daily
+from top_n import build_rankings, merge_rankings, precompute_rankings
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Embedded database backend (SUPERSTORE_BACKEND=sqlite or duckdb, pandas by default).
+# The orders of the dataset cache are copied once in a database file next to the cache (Data/.cache/<name>/orders.*),
+# then the queries of the callbacks are SQL (filter by year/segment/category, group by month/segment/category/country,
+# sum the measures) and the rows are not loaded in the memory of the app.
+# DuckDB scans the table with SUPERSTORE_DB_THREADS threads (all the cores by default). SQLite runs a query on one
+# core, it reads covering indexes of the filter columns instead of the table.
+# The database is a read only snapshot of the dataset, shared by the gunicorn workers: the orders appended while
+# the app is running are aggregated in memory (ChunkedStore) and added to the results of the queries.
+
+BACKEND = os.environ.get('SUPERSTORE_BACKEND', 'pandas')
+DB_THREADS = int(os.environ.get('SUPERSTORE_DB_THREADS', os.cpu_count() or 1))
+
+# columns of the orders table, row is the position of the order in the dataset
+TABLE_COLUMNS = ['row', 'order_year', 'order_month', 'Segment', 'Category', 'Country', 'Market', 'iso_alpha',
+                 'Order ID', 'Sales', 'Profit', 'Quantity', 'Discount']
+TEXT_COLUMNS = ['Segment', 'Category', 'Country', 'Market', 'iso_alpha', 'Order ID']
+
+SQLITE_INDEXES = [
+    'CREATE INDEX orders_filters ON orders (order_year, Segment, Category, order_month, {})'.format(
+        ', '.join(MEASURES)),
+    'CREATE INDEX orders_countries ON orders (order_year, Country, "Order ID", Sales, Profit)',
+]
+
+INSERT_ROWS = 200000
+
+
+def connect(path, engine, read_only=True):
+    if engine == 'duckdb':
+        import duckdb
+        connection = duckdb.connect(path, read_only=read_only)
+        connection.execute('SET threads TO {}'.format(DB_THREADS))
+        return connection
+    if engine == 'sqlite':
+        uri = 'file:{}?mode=ro'.format(path) if read_only else 'file:{}'.format(path)
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+    raise ValueError('unknown backend: {}'.format(engine))
+
+
+def get_database_path(csv_path, engine):
+    return os.path.join(get_cache_dir(csv_path), 'orders.' + engine)
+
+
+# copy the orders in a new database file
+def build_database(data, path, engine):
+    tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    types = {'row': 'BIGINT', 'order_year': 'INTEGER', 'order_month': 'INTEGER'}
+    types.update({column: 'VARCHAR' for column in TEXT_COLUMNS})
+    schema = ', '.join('"{}" {}'.format(column, types.get(column, 'DOUBLE')) for column in TABLE_COLUMNS)
+
+    connection = connect(tmp_path, engine, read_only=False)
+    try:
+        connection.execute('CREATE TABLE orders ({})'.format(schema))
+        for start in range(0, len(data), INSERT_ROWS):
+            chunk = data.iloc[start:start + INSERT_ROWS]
+            rows = pd.DataFrame({'row': range(start, start + len(chunk))}, index=chunk.index)
+            rows = rows.join(chunk[TABLE_COLUMNS[1:]].astype({column: object for column in TEXT_COLUMNS}))
+            if engine == 'duckdb':
+                connection.register('chunk', rows)
+                connection.execute('INSERT INTO orders SELECT * FROM chunk')
+                connection.unregister('chunk')
+            else:
+                rows = rows.astype(object).where(rows.notna(), None)
+                connection.executemany('INSERT INTO orders VALUES ({})'.format(', '.join('?' * len(TABLE_COLUMNS))),
+                                       rows.itertuples(index=False, name=None))
+        if engine == 'sqlite':
+            for index in SQLITE_INDEXES:
+                connection.execute(index)
+            connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+# the conditions of the filters which are not None
+def get_where(**filters):
+    conditions, parameters = [], []
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append('"{}" = ?'.format(column))
+            parameters.append(int(value) if column == 'order_year' else value)
+    return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+
+MEASURES_SQL = ', '.join('SUM("{0}") AS "{0}"'.format(measure) for measure in MEASURES)
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+
+class DatabaseStore(BaseStore):
+    def __init__(self, path, engine, daily, rankings):
+        # the prefix sums of the daily measures and the rankings of the top-N tables are in memory, like the cube
+        # of the other backends, the monthly measures and the totals of the countries are queried (see monthly and
+        # year_totals)
+        super().__init__(daily=daily, rankings=rankings)
+        self.path = path
+        self.engine = engine
+        self.dtypes = BATCH_DTYPES
+        self._local = threading.local()
+        # aggregates of the orders appended while the app is running
+        self._appended = None
+
+        countries = self.query('SELECT Country, Market, iso_alpha FROM orders WHERE row IN '
+                               '(SELECT MIN(row) FROM orders GROUP BY Country)')
+        self.countries = countries.set_index('Country').sort_index()
+        iso_codes = self.query('SELECT Country, iso_alpha FROM orders WHERE row IN '
+                               '(SELECT MIN(row) FROM orders WHERE iso_alpha IS NOT NULL GROUP BY Country)')
+        self.iso_codes = dict(zip(iso_codes['Country'], iso_codes['iso_alpha']))
+        self._values = {column: list(self.query('SELECT "{0}" FROM orders WHERE "{0}" IS NOT NULL GROUP BY "{0}" '
+                                                'ORDER BY MIN(row)'.format(column))[column])
+                        for column in ['order_year', 'Segment', 'Category']}
+
+    # one connection per thread
+    def query(self, sql, parameters=()):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path, self.engine)
+        cursor = connection.execute(sql, parameters)
+        columns = [description[0] for description in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+    def values(self, column):
+        values = list(self._values[column])
+        if self._appended is not None:
+            values.extend(value for value in self._appended.values(column) if value not in values)
+        return values
+
+    @profiled('pandas')
+    def monthly(self, year=None, segment=None, category=None):
+        year = None if year is None else int(year)
+        return self._selection(('monthly', year, segment, category), lambda: self._monthly(year, segment, category))
+
+    def _monthly(self, year, segment, category):
+        where, parameters = get_where(order_year=year, Segment=segment, Category=category)
+        monthly = self.query('SELECT order_month, {} FROM orders{} GROUP BY order_month'.format(MEASURES_SQL, where),
+                             parameters).set_index('order_month')
+        monthly_data = pd.DataFrame(monthly.reindex(MONTHS, fill_value=0).to_numpy(dtype=float), columns=MEASURES)
+        if self._appended is not None:
+            monthly_data += cube_monthly(self._appended.cube, year, segment, category)[MEASURES]
+        monthly_data.insert(0, 'order_month', MONTHS)
+        return monthly_data
+
+    @profiled('pandas')
+    def by(self, dimension, year=None, segment=None, category=None):
+        year = None if year is None else int(year)
+        if dimension == 'Segment':
+            where, parameters = get_where(order_year=year, Category=category)
+        else:
+            where, parameters = get_where(order_year=year, Segment=segment)
+        totals = self.query('SELECT "{0}", {1} FROM orders{2} GROUP BY "{0}"'.format(dimension, MEASURES_SQL, where),
+                            parameters).set_index(dimension)
+        if self._appended is not None:
+            appended = cube_by(self._appended.cube, dimension, year, segment, category).set_index(dimension)
+            totals = totals.add(appended, fill_value=0)
+
+        labels = sorted(self.values(dimension))
+        totals = totals.reindex(labels, fill_value=0).astype(float)
+        return totals.rename_axis(dimension).reset_index()
+
+    # orders, sales and profit of every country of the year (all the years for None), used by map_data
+    def year_totals(self, year=None):
+        where, parameters = get_where(order_year=year)
+        totals = self.query('SELECT Country, COUNT("Order ID") AS OrderCount_Per_Country, '
+                            'SUM(Sales) AS TotalSales_Per_Country, SUM(Profit) AS Profit '
+                            'FROM orders{} GROUP BY Country'.format(where), parameters).set_index('Country')
+        # the columns of an empty result have no type, e.g. a year of the appended orders only
+        totals = totals.astype({'OrderCount_Per_Country': 'int64', 'TotalSales_Per_Country': float, 'Profit': float})
+        if self._appended is not None:
+            totals = pd.concat([totals, self._appended.year_totals(year)]).groupby(level='Country').sum()
+        return totals.sort_index()
+
+    # the connections of the threads are not shared with a forked process
+    def reset_after_fork(self):
+        super().reset_after_fork()
+        self._local = threading.local()
+
+    # the aggregates of the appended orders are counted with their own names
+    def memory_usage(self):
+        usage = super().memory_usage()
+        if self._appended is not None:
+            usage.update(('appended_' + name, size) for name, size in self._appended.memory_usage().items())
+        return usage
+
+    def append(self, batch):
+        if batch.empty:
+            return
+        with self.lock:
+            if self._appended is None:
+                self._appended = ChunkedStore([batch])
+            else:
+                self._appended.add_chunk(batch)
+            self._daily = merge_daily([self._daily, build_daily(batch)])
+            self._rankings = merge_rankings([self._rankings, build_rankings(batch)])
+            self.countries = update_country_table(self.countries, batch)
+            iso_codes = batch[['Country', 'iso_alpha']].dropna().drop_duplicates('Country')
+            self.iso_codes.update(zip(iso_codes['Country'], iso_codes['iso_alpha']))
+            self._selections = {}
+            self.version += 1
+
+
+def load_database_store(csv_path=DATA_PATH, engine=BACKEND):
+    start = time.perf_counter()
+    path = get_database_path(csv_path, engine)
+    # checks the cache of the CSV (rebuilt with a new database when the CSV changes)
+    data = load_data(csv_path, mmap_mode='r')
+    with cache_lock(path):
+        if not os.path.exists(path):
+            build_database(data, path, engine)
+    daily = load_aggregate(csv_path, 'daily', build_daily, data, mmap_mode='r')
+    rankings = load_aggregate(csv_path, 'rankings',
+                              partial(precompute_rankings, load_rows=partial(load_cached_rows, csv_path)),
+                              data, mmap_mode='r')
+    del data
+    print('opened the {} database {} in {:.2f}s'.format(engine, path, time.perf_counter() - start))
+    return DatabaseStore(path, engine, daily, rankings)
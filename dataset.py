@@ -0,0 +1,395 @@
+import os
+import sys
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from bitmap_index import ROW_ID_COLUMNS, add_row_ids, append_index, build_index, has_row_ids, index_values, select_rows
+from cube import build_cube, cube_by, cube_monthly, merge_cubes
+from data_cache import cache_lock, get_cache_dir, load_data, read_arrays, read_cache, read_meta, write_arrays
+from map_data import (Create_DataFrame_From_Totals, get_country_table, get_country_totals, merge_country_totals,
+                      update_country_table)
+from precompute import country_totals_from_arrays, country_totals_to_arrays, precompute_aggregates
+from profiling import profiled
+from single_flight import SingleFlight
+from timeseries import build_daily, get_time_series, merge_daily
+from top_n import TOP_N, build_rankings, merge_rankings, precompute_rankings, top_items
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Load the dataset and the aggregates used by the dashboard.
+# In the shared memory mode the dataset cache and the aggregates are memory mapped read only, so all the
+# gunicorn workers attach to the same pages instead of keeping a private copy each. They are built once, by the
+# first worker which gets the lock of the cache, or ahead by prepare_dataset (python dataset.py).
+
+DATA_PATH = 'Data/data_complete_with_iso.csv'
+SHARED_MEMORY = os.environ.get('SUPERSTORE_SHARED_MEMORY', '0') == '1'
+
+# most of the filter selections kept by DataStore.monthly and DataStore.map_data
+MAX_SELECTIONS = 1024
+
+# the filter columns, they are categorical so the filters compare integer codes and not strings
+DIMENSION_COLUMNS = ['Segment', 'Category', 'Market', 'Country']
+
+
+# read an aggregate saved in the cache, build and save it if it's not there yet
+def load_aggregate(csv_path, name, build, df, mmap_mode=None):
+    folder = os.path.join(get_cache_dir(csv_path), 'aggregates', name)
+    with cache_lock(folder):
+        arrays = read_arrays(folder, mmap_mode=mmap_mode)
+        if arrays is None:
+            write_arrays(folder, build(df))
+            arrays = read_arrays(folder, mmap_mode=mmap_mode)
+    return arrays
+
+
+def set_dimension_types(data):
+    for column in DIMENSION_COLUMNS:
+        if not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+    return data
+
+
+# the rows of the dataset cache, memory mapped by the workers of the precompute (see precompute_aggregates),
+# the cache was loaded (and checked) by the parent process
+def load_cached_rows(csv_path):
+    cache_dir = get_cache_dir(csv_path)
+    return set_dimension_types(read_cache(cache_dir, read_meta(cache_dir), mmap_mode='r'))
+
+
+# the dataset with its cube and the totals of the countries per year (see precompute.py)
+def load_dataset(csv_path=DATA_PATH, shared=SHARED_MEMORY):
+    data = set_dimension_types(load_data(csv_path, mmap_mode='r' if shared else None))
+    load_rows = partial(load_cached_rows, csv_path)
+
+    if not shared:
+        return (data,) + precompute_aggregates(data, load_rows=load_rows)
+
+    # both of them are computed by the same precompute when one of them is not in the cache
+    aggregates = {}
+
+    def build(name):
+        def build_arrays(df):
+            if not aggregates:
+                aggregates['cube'], country_totals = precompute_aggregates(df, load_rows=load_rows)
+                aggregates['country_totals'] = country_totals_to_arrays(country_totals)
+            return aggregates[name]
+        return build_arrays
+
+    cube = load_aggregate(csv_path, 'cube', build('cube'), data, mmap_mode='r')
+    country_totals = load_aggregate(csv_path, 'country_totals', build('country_totals'), data)
+    return data, cube, country_totals_from_arrays(country_totals)
+
+
+# concatenate the dataset with the appended batches, keeping the categorical columns categorical
+def concat_chunks(chunks):
+    if len(chunks) == 1:
+        return chunks[0]
+    data = pd.concat(chunks, ignore_index=True)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals([pd.Categorical(chunk[column]) for chunk in chunks],
+                                              sort_categories=True)
+    return data
+
+
+# bytes of a frame, an array or a dict/list of them, None for the other values
+def get_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (dict, list)):
+        sizes = [get_nbytes(item) for item in (value.values() if isinstance(value, dict) else value)]
+        sizes = [size for size in sizes if size is not None]
+        return sum(sizes) if sizes else None
+    return None
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# The aggregates of the orders and the queries of the callbacks and the api (values, monthly, by, time_series, top,
+# map_data, market_data), the interface of the backends: DataStore (the rows in memory), ChunkedStore (out_of_core.py,
+# the aggregates only) and DatabaseStore (database.py, SQL queries).
+# The map is built from the totals of the countries per year (see precompute.py).
+
+class BaseStore:
+    # the rows of the orders are in memory (drill-down of the cities)
+    keeps_rows = False
+    # aggregates of the selections found in the memo and computed (see metrics.py)
+    selection_hits = 0
+    selection_misses = 0
+
+    def __init__(self, cube=None, country_totals=None, daily=None, rankings=None):
+        self.cube = cube
+        self.country_totals = country_totals
+        self._daily = daily
+        self._rankings = rankings
+        self._selections = {}
+        self._flights = SingleFlight()
+        # number of batches of new orders appended
+        self.version = 0
+        self.lock = threading.RLock()
+
+    # prefix sums of the daily measures (see timeseries.py)
+    @property
+    def daily(self):
+        return self._daily
+
+    # measures of the sub-categories, cities and products per year, segment and category (see top_n.py)
+    @property
+    def rankings(self):
+        return self._rankings
+
+    # build the indexes before the first callbacks
+    def prepare(self):
+        pass
+
+    # values of a filter column for the dropdowns, in order of appearance
+    def values(self, column):
+        raise NotImplementedError
+
+    # aggregate of a selection computed once for all the callbacks and the api (they must not change it),
+    # the requests for the same selection at the same time wait for the first one
+    def _selection(self, key, compute):
+        with self.lock:
+            selections, version = self._selections, self.version
+            result = selections.get(key)
+            if result is None:
+                self.selection_misses += 1
+            else:
+                self.selection_hits += 1
+        if result is None:
+            result = self._flights.do((version, key), compute)
+            if len(selections) >= MAX_SELECTIONS:
+                selections.clear()
+            selections[key] = result
+        return result
+
+    # the parts of the store counted by memory_usage
+    def _memory_parts(self):
+        return {'cube': self.cube, 'country_totals': self.country_totals, 'daily': self._daily,
+                'rankings': self._rankings}
+
+    # bytes of every aggregate in memory (the memory mapped ones too)
+    def memory_usage(self):
+        with self.lock:
+            parts = self._memory_parts()
+        sizes = {name: get_nbytes(value) for name, value in parts.items()}
+        return {name: size for name, size in sizes.items() if size is not None}
+
+    # in a process forked from a threaded one (background callbacks), the locks may be held by threads which don't
+    # exist in it
+    def reset_after_fork(self):
+        self.lock = threading.RLock()
+        self._flights.reset_after_fork()
+
+    # forget the aggregates of the selections, the next callbacks compute them again
+    def clear_selections(self):
+        with self.lock:
+            self._selections = {}
+
+    # monthly measures of the filters
+    @profiled('pandas')
+    def monthly(self, year=None, segment=None, category=None):
+        year = None if year is None else int(year)
+        cube = self.cube
+        return self._selection(('monthly', year, segment, category),
+                               lambda: cube_monthly(cube, year, segment, category))
+
+    # total of the measures per segment or per category of the filters (see cube_by)
+    def by(self, dimension, year=None, segment=None, category=None):
+        return cube_by(self.cube, dimension, year, segment, category)
+
+    # measures per day/week/month... of a date range, with the rolling sums and the year before (see get_time_series)
+    @profiled('pandas')
+    def time_series(self, start=None, end=None, granularity='month', segment=None, category=None, window=None,
+                    yoy=False):
+        key = ('time_series', start, end, granularity, segment, category, window, yoy)
+        daily = self.daily
+        return self._selection(key, lambda: get_time_series(daily, start, end, granularity, segment, category,
+                                                            window, yoy))
+
+    # the n sub-categories, cities or products with the most of the measure for the filters (see top_items)
+    @profiled('pandas')
+    def top(self, dimension, year=None, segment=None, category=None, n=TOP_N, measure='Sales'):
+        year = None if year is None else int(year)
+        rankings = self.rankings
+        return self._selection(('top', dimension, year, segment, category, n, measure),
+                               lambda: top_items(rankings, dimension, year, segment, category, n, measure))
+
+    # orders, sales and profit per country and per market of the year (see Create_DataFrame_From_Totals)
+    @profiled('pandas')
+    def map_data(self, year=None):
+        year = None if year is None else int(year)
+        return self._selection(('map', year), lambda: Create_DataFrame_From_Totals(self.year_totals(year),
+                                                                                   self.countries))
+
+    # totals of the countries for the year (all the years for None)
+    def year_totals(self, year=None):
+        totals = self.country_totals
+        if year is None:
+            return totals.groupby(level='Country', observed=True).sum()
+        return totals[totals.index.get_level_values('order_year') == year].droplevel('order_year')
+
+    # orders, sales and profit per market of the year
+    @profiled('pandas')
+    def market_data(self, year=None):
+        year = None if year is None else int(year)
+        columns = ['Market', 'OrderCount_Per_Market', 'TotalSales_Per_Market', 'TotalProfit_Per_Market']
+        return self._selection(('market', year), lambda: self.map_data(year)[columns].drop_duplicates('Market')
+                               .sort_values('Market').set_index('Market'))
+
+    def append(self, batch):
+        raise NotImplementedError
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# The dataset with its aggregates. New batches of orders are appended to it while the app is running:
+# the aggregates of the batch are merged to the aggregates, its rows are added to the bitmap index and kept as a
+# separate chunk, so appending costs the size of the batch. The queries read the rows of the chunks, they are
+# concatenated only when all the rows are read again (an aggregate which was not built yet).
+
+class DataStore(BaseStore):
+    keeps_rows = True
+
+    def __init__(self, data, cube, country_totals, index=None, daily=None, rankings=None, csv_path=None):
+        super().__init__(cube, country_totals, daily, rankings)
+        # the CSV of the dataset cache, the workers of the precompute read the rows from it
+        self.csv_path = csv_path
+        self._chunks = [data]
+        self._data = data
+        self._index = index
+        # types of the columns, the new orders are converted to them (see prepare_batch)
+        self.dtypes = data.dtypes.to_dict()
+
+        # Market and iso_alpha of every country, used by the map and for the new orders
+        self.countries = get_country_table(data)
+        iso_codes = data[['Country', 'iso_alpha']].dropna().drop_duplicates('Country')
+        self.iso_codes = dict(zip(iso_codes['Country'], iso_codes['iso_alpha']))
+
+    @property
+    def data(self):
+        with self.lock:
+            if self._data is None:
+                self._data = concat_chunks(self._chunks)
+                self._chunks = [self._data]
+            return self._data
+
+    # bitmap index of the filter columns (see bitmap_index.py)
+    @property
+    def index(self):
+        with self.lock:
+            if self._index is None:
+                self._index = build_index(self.data)
+            return self._index
+
+    # the aggregates which were not loaded are built from the rows
+    @property
+    def daily(self):
+        with self.lock:
+            if self._daily is None:
+                self._daily = build_daily(self.data)
+            return self._daily
+
+    @property
+    def rankings(self):
+        with self.lock:
+            if self._rankings is None:
+                # the rows are the ones of the cache until new orders are appended
+                load_rows = None
+                if self.csv_path is not None and self.version == 0:
+                    load_rows = partial(load_cached_rows, self.csv_path)
+                self._rankings = precompute_rankings(self.data, load_rows=load_rows)
+            return self._rankings
+
+    # build the indexes before the first callbacks
+    def prepare(self):
+        self.index
+        self.daily
+        self.rankings
+
+    # values of a filter column for the dropdowns, in order of appearance
+    def values(self, column):
+        return index_values(self.index, column)
+
+    # rows of the dataset which match the filters, e.g. {'order_year': 2013, 'Segment': 'Consumer'}
+    @profiled('filter')
+    def select(self, filters, columns=None):
+        with self.lock:
+            index = self.index
+            chunks = list(self._chunks)
+            if not has_row_ids(index) and any(filters.get(column) is not None for column in ROW_ID_COLUMNS):
+                index = self._index = add_row_ids(index, concat_chunks([chunk[ROW_ID_COLUMNS] for chunk in chunks]))
+        rows = select_rows(index, filters)
+        # the rows of every chunk, the row ids of a chunk start after the rows of the chunks before it
+        bounds = np.cumsum([0] + [len(chunk) for chunk in chunks])
+        selected = []
+        for chunk, start, stop in zip(chunks, bounds, bounds[1:]):
+            first, last = np.searchsorted(rows, [start, stop])
+            selected.append((chunk if columns is None else chunk[columns]).take(rows[first:last] - start))
+        return concat_chunks(selected)
+
+    # the rows are counted with their strings so it takes some time on a large dataset
+    def _memory_parts(self):
+        return dict(super()._memory_parts(), data=self._chunks, index=self._index)
+
+    # sales of the top cities of the country in the year, the other cities of the country are one bin
+    @profiled('pandas')
+    def city_sales(self, country, year=None, top=10):
+        year = None if year is None else int(year)
+        return self._selection(('cities', country, year, top), lambda: self._city_sales(country, year, top))
+
+    def _city_sales(self, country, year, top):
+        sales = self.select({'order_year': year, 'Country': country}, ['City', 'Sales'])
+        sales = sales.groupby('City', observed=True)['Sales'].sum().sort_values(ascending=False)
+        sales.index = sales.index.astype(str)
+        if len(sales) > top:
+            sales = pd.concat([sales.iloc[:top], pd.Series({'Other cities': sales.iloc[top:].sum()})])
+        return np.round(sales).rename_axis('City').rename('Sales').reset_index()
+
+    def append(self, batch):
+        batch_cube = build_cube(batch)
+        batch_totals = get_country_totals(batch, by=['order_year'])
+        batch_daily = build_daily(batch)
+        batch_rankings = build_rankings(batch)
+        iso_codes = batch[['Country', 'iso_alpha']].dropna().drop_duplicates('Country')
+
+        with self.lock:
+            self._chunks.append(batch)
+            self._data = None
+            if self._index is not None:
+                self._index = append_index(self._index, batch)
+            self._selections = {}
+            self.cube = merge_cubes(self.cube, batch_cube)
+            if self._daily is not None:
+                self._daily = merge_daily([self._daily, batch_daily])
+            if self._rankings is not None:
+                self._rankings = merge_rankings([self._rankings, batch_rankings])
+            self.country_totals = merge_country_totals([self.country_totals, batch_totals])
+            self.countries = update_country_table(self.countries, batch)
+            self.iso_codes.update(zip(iso_codes['Country'], iso_codes['iso_alpha']))
+            self.version += 1
+
+
+def load_store(csv_path=DATA_PATH, shared=SHARED_MEMORY):
+    data, cube, country_totals = load_dataset(csv_path, shared=shared)
+    index = None
+    daily = None
+    rankings = None
+    if shared:
+        index = load_aggregate(csv_path, 'bitmap_index', build_index, data, mmap_mode='r')
+        daily = load_aggregate(csv_path, 'daily', build_daily, data, mmap_mode='r')
+        rankings = load_aggregate(csv_path, 'rankings',
+                                  partial(precompute_rankings, load_rows=partial(load_cached_rows, csv_path)),
+                                  data, mmap_mode='r')
+    return DataStore(data, cube, country_totals, index=index, daily=daily, rankings=rankings, csv_path=csv_path)
+
+
+def prepare_dataset(csv_path=DATA_PATH):
+    load_store(csv_path, shared=True)
+
+
+if __name__ == '__main__':
+    prepare_dataset(sys.argv[1] if len(sys.argv) > 1 else DATA_PATH)
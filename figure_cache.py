@@ -0,0 +1,83 @@
+import json
+import threading
+from collections import OrderedDict
+
+from profiling import profiled
+from single_flight import SingleFlight
+
+# -------------------------------------------------------------------------------------------------------------------------
+# LRU cache of the figures returned by the callbacks.
+# The figures are kept serialized (the JSON of plotly) with the key of the filters of the callback and the version
+# of the dataset, the least recently used ones are removed when the total size of the JSON is above max_bytes.
+# When the version of the dataset changes (new orders appended) all the figures are removed.
+# A figure which is not in the cache is built once for the requests which ask for it at the same time (single_flight.py).
+
+
+# JSON of a plotly figure
+@profiled('plotly')
+def figure_to_json(figure):
+    return figure.to_json()
+
+
+class FigureCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._bytes = 0
+
+    # get the figure of the key, build it with build() and keep it if it's not in the cache
+    def get(self, key, version, build):
+        with self._lock:
+            if version != self.version:
+                self._figures.clear()
+                self._bytes = 0
+                self.version = version
+
+            figure_json = self._figures.get(key)
+            if figure_json is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return json.loads(figure_json)
+            self.misses += 1
+
+        figure_json = self._flights.do((key, version), lambda: self._build(key, version, build))
+        return json.loads(figure_json)
+
+    def _build(self, key, version, build):
+        figure_json = figure_to_json(build())
+        self._put(key, version, figure_json)
+        return figure_json
+
+    def _put(self, key, version, figure_json):
+        size = len(figure_json)
+        with self._lock:
+            if version != self.version or size > self.max_bytes or key in self._figures:
+                return
+            self._figures[key] = figure_json
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, removed = self._figures.popitem(last=False)
+                self._bytes -= len(removed)
+
+    # in a process forked from a threaded one, the lock may be held by a thread which doesn't exist in it
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._flights.reset_after_fork()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / requests if requests else 0.0,
+                    'coalesced': self._flights.coalesced, 'in_flight': self._flights.in_flight(),
+                    'entries': len(self._figures), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'version': self.version}
@@ -0,0 +1,11 @@
+# gunicorn --config gunicorn.conf.py app:server
+import os
+
+# the workers attach to the memory mapped dataset instead of loading a private copy each
+os.environ.setdefault('SUPERSTORE_SHARED_MEMORY', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', 16))
+
+# the first worker which gets the lock of the cache builds the cache and the aggregates in its startup thread,
+# the other workers wait for the lock and read them (python dataset.py builds them before starting gunicorn)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from cube import MEASURES
+from data_cache import DATE_COLUMNS, add_date_parts
+from iso_resolver import add_iso_codes
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Append new orders to the running dashboard.
+# Every .csv or .parquet file dropped in Data/incoming/ is a batch of new orders (same columns as the dataset CSV).
+# A watcher thread in every process appends the files it didn't see yet to the DataStore, in the order of
+# their names. The files are kept, so a restarted app loads the dataset CSV and then the same batches again.
+# Write the files with another name first (e.g. a .tmp suffix) and rename them when they are complete.
+
+INCOMING_FOLDER = 'Data/incoming'
+BATCH_EXTENSIONS = ('.csv', '.parquet')
+
+
+def read_batch(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+# parse the dates and the measures, derive the year and the month, add the iso_alpha codes of the countries and keep
+# the columns of the store (dtypes of the store), a batch without the dates or with values which are not numbers
+# raises KeyError or ValueError
+def prepare_batch(batch, dtypes, iso_codes):
+    batch = batch.copy()
+    for column in DATE_COLUMNS:
+        batch[column] = pd.to_datetime(batch[column], infer_datetime_format=True)
+    for measure in MEASURES:
+        if measure in batch.columns:
+            batch[measure] = pd.to_numeric(batch[measure])
+    add_date_parts(batch)
+
+    iso_alpha = batch['Country'].map(iso_codes)
+    if 'iso_alpha' in batch.columns:
+        iso_alpha = batch['iso_alpha'].fillna(iso_alpha)
+    batch['iso_alpha'] = iso_alpha
+    # the countries which are not in the dataset yet
+    add_iso_codes(batch)
+
+    batch = batch.reindex(columns=list(dtypes))
+    # the text columns are strings (None for the missing values and columns) like the categories of the dataset,
+    # so the batch can always be concatenated with its categorical columns
+    for column, dtype in dtypes.items():
+        if pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+            values = batch[column]
+            batch[column] = values.astype(str).where(values.notna(), None)
+    return batch
+
+
+def append_batch(store, batch):
+    batch = prepare_batch(batch, store.dtypes, store.iso_codes)
+    store.append(batch)
+    return batch
+
+
+def ingest_file(store, path):
+    start = time.perf_counter()
+    batch = append_batch(store, read_batch(path))
+    print('appended {:,} rows from {} in {:.2f}s'.format(len(batch), path, time.perf_counter() - start))
+    return batch
+
+
+def ingest_folder(store, folder, seen):
+    if not os.path.isdir(folder):
+        return
+    for file_name in sorted(os.listdir(folder)):
+        if file_name in seen or not file_name.endswith(BATCH_EXTENSIONS):
+            continue
+        seen.add(file_name)
+        try:
+            ingest_file(store, os.path.join(folder, file_name))
+        except Exception as error:
+            print('could not append {}: {}'.format(file_name, error))
+
+
+def watch_folder(store, folder=INCOMING_FOLDER, interval=5):
+    seen = set()
+    ingest_folder(store, folder, seen)
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            ingest_folder(store, folder, seen)
+
+    thread = threading.Thread(target=watch, name='ingest-watcher', daemon=True)
+    thread.start()
+    return seen
+
+
+# save a batch sent to the app in the incoming folder, the watchers of the other processes append it too
+def save_batch(batch, seen, folder=INCOMING_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    file_name = 'batch-{}-{:09d}.csv'.format(time.strftime('%Y%m%d%H%M%S'), time.time_ns() % 10 ** 9)
+    tmp_path = os.path.join(folder, '.' + file_name + '.tmp')
+    batch.to_csv(tmp_path, index=False)
+    # this process appends the batch itself, its watcher must skip the file
+    seen.add(file_name)
+    os.replace(tmp_path, os.path.join(folder, file_name))
+    return file_name
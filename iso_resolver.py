@@ -0,0 +1,123 @@
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------------------------------------------------------------
+# ISO alpha-3 codes of the countries of the orders, without network (it replaces Notebooks/iso_apha_webscraping.ipynb).
+# The ISO 3166 names and some common aliases are bundled in iso_countries.csv. The names are normalized (no accents,
+# no punctuation, lower case) and indexed twice: a dict for the exact names and the aliases, and a trie of the
+# characters for the prefixes. A country is resolved with
+#   1. the exact name or alias, e.g. 'Swaziland' -> SWZ
+#   2. the only ISO name that starts with it, e.g. 'Tanzania' -> 'Tanzania, United Republic of' -> TZA
+#   3. the longest ISO name which is a prefix of it at a word boundary, e.g. 'Myanmar (Burma)' -> 'Myanmar' -> MMR
+# so 'Niger' is NER and not NGA, and an ambiguous prefix ('Korea') is not resolved.
+# A column is resolved once per distinct country (pd.factorize) and the resolved names are cached.
+# python iso_resolver.py Global_Superstore2.csv Data/data_complete_with_iso.csv
+
+ISO_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'iso_countries.csv')
+
+# key of the codes of the names which end at a node of the trie
+END = ''
+
+
+def normalize(name):
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(character for character in name if not unicodedata.combining(character)).lower()
+    name = re.sub(r'[^a-z0-9]+', ' ', name.replace('&', ' and ')).strip()
+    return re.sub(r'^the ', '', name)
+
+
+class CountryResolver:
+    def __init__(self, table):
+        self.names = {}
+        self.trie = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+        for name, iso_alpha, aliases in table[['name', 'iso_alpha', 'aliases']].fillna('').itertuples(index=False):
+            key = normalize(name)
+            self.names[key] = iso_alpha
+            self._add_prefix(key, iso_alpha)
+            for alias in filter(None, aliases.split(';')):
+                self.names[normalize(alias)] = iso_alpha
+
+    # every node keeps the codes of the names below it, END the code of the name which ends there
+    def _add_prefix(self, key, iso_alpha):
+        node = self.trie
+        for character in key:
+            node = node.setdefault(character, {})
+            node.setdefault(None, set()).add(iso_alpha)
+        node[END] = iso_alpha
+
+    def _match_prefix(self, key):
+        node, longest = self.trie, None
+        for character in key:
+            if character == ' ' and END in node:
+                longest = node[END]
+            node = node.get(character)
+            if node is None:
+                return longest
+        codes = node[None]
+        return next(iter(codes)) if len(codes) == 1 else longest
+
+    # ISO alpha-3 code of a country, None when it's not found or ambiguous
+    def resolve(self, country):
+        if country is None or country != country:
+            return None
+        resolved = self._resolved.get(country, self)
+        if resolved is self:
+            key = normalize(country)
+            resolved = self.names.get(key) or (self._match_prefix(key) if key else None)
+            with self._lock:
+                self._resolved[country] = resolved
+        return resolved
+
+    # codes of a column of countries, resolved once per distinct country
+    def resolve_column(self, countries):
+        codes, uniques = pd.factorize(countries)
+        resolved = np.array([self.resolve(country) for country in uniques] + [None], dtype=object)
+        return pd.Series(resolved[codes], index=countries.index, name='iso_alpha')
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver(path=ISO_TABLE_PATH):
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = CountryResolver(pd.read_csv(path, keep_default_na=False, na_values=['']))
+        return _resolver
+
+
+# fill the missing iso_alpha codes of the orders (the column is added when there is none)
+def add_iso_codes(df):
+    if 'iso_alpha' not in df.columns:
+        df['iso_alpha'] = get_resolver().resolve_column(df['Country'])
+        return df
+    missing = df['iso_alpha'].isna()
+    if missing.any():
+        iso_alpha = df['iso_alpha'].astype(object)
+        iso_alpha[missing] = get_resolver().resolve_column(df.loc[missing, 'Country'])
+        df['iso_alpha'] = iso_alpha
+    return df
+
+
+if __name__ == '__main__':
+    # add the iso_alpha column to a CSV of orders, e.g. the Global Superstore dataset
+    source, target = sys.argv[1], sys.argv[2]
+    start = time.perf_counter()
+    orders = pd.read_csv(source, encoding='unicode_escape')
+    orders = add_iso_codes(orders.drop(columns='iso_alpha', errors='ignore'))
+    orders.to_csv(target, index=False)
+
+    unresolved = sorted(orders.loc[orders['iso_alpha'].isna(), 'Country'].dropna().unique())
+    print('{:,} rows, {} countries in {:.2f}s, not resolved: {}'.format(
+        len(orders), orders['Country'].nunique(), time.perf_counter() - start, unresolved or 'none'))
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Data of the map and the market graphs.
+# The market and the iso_alpha of the countries don't change with the filters, so they are kept in a
+# country dimension table built once when the dataset is loaded (DataStore.countries). The map only
+# needs one groupby of the orders per country, the totals of the markets are computed from the country totals.
+
+
+# get the Market and the iso_alpha of each country (the first ones found in the orders)
+def get_country_table(df):
+    countries = df.loc[:, ['Country', 'Market', 'iso_alpha']].drop_duplicates('Country')
+    return countries.set_index('Country').sort_index()
+
+
+# add the countries of new orders to the country table
+def update_country_table(countries, df):
+    new_countries = get_country_table(df)
+    new_countries = new_countries[~new_countries.index.isin(countries.index)]
+    if new_countries.empty:
+        return countries
+    return pd.concat([countries, new_countries]).sort_index()
+
+
+# first get the orderCount and the total sales for each country
+def get_country_orders(df):
+    country_orders = df.groupby("Country", observed=True).agg({'Order ID': 'count', 'Sales': 'sum'}).sort_index()
+    country_orders.rename(columns={"Order ID": "OrderCount_Per_Country", "Sales": "TotalSales_Per_Country"},
+                          inplace=True)
+    country_orders["TotalSales_Per_Country"] = np.round(country_orders["TotalSales_Per_Country"])
+    return country_orders
+
+
+# then get the order counte,totalsales,total profit for each Market
+def get_market_order(df):
+    Markets_Order = df.groupby("Market", observed=True).agg({'Order ID': 'count', 'Sales': 'sum', 'Profit': 'sum'})
+    Markets_Order.sort_index(inplace=True)
+    Markets_Order.rename(columns={"Order ID": "OrderCount_Per_Market", "Sales": "TotalSales_Per_Market",
+                                  "Profit": "TotalProfit_Per_Market"}, inplace=True)
+    Markets_Order["TotalSales_Per_Market"] = np.round(Markets_Order["TotalSales_Per_Market"])
+    Markets_Order["TotalProfit_Per_Market"] = np.round(Markets_Order["TotalProfit_Per_Market"])
+    return Markets_Order
+
+
+# orders, sales and profit of every country (by can add other keys before the country, e.g. order_year),
+# the totals of several parts of the orders can be added together
+def get_country_totals(df, by=()):
+    return df.groupby(list(by) + ["Country"], observed=True).agg(OrderCount_Per_Country=('Order ID', 'count'),
+                                                                 TotalSales_Per_Country=('Sales', 'sum'),
+                                                                 Profit=('Profit', 'sum')).sort_index()
+
+
+# add the totals per (order_year, Country) of several parts of the orders, in the order of the parts
+def merge_country_totals(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=['order_year', 'Country'], observed=True).sum()
+
+
+# merge all the data
+def Create_DataFrame_For_Map(df, countries=None):
+    if countries is None:
+        countries = get_country_table(df)
+
+    # one pass over the orders, then everything else is done on the countries
+    return Create_DataFrame_From_Totals(get_country_totals(df), countries)
+
+
+# data of the map from the totals of the countries (get_country_totals)
+def Create_DataFrame_From_Totals(country_order, countries):
+    country_order = country_order.join(countries, how='inner')
+
+    market_order = country_order.groupby("Market", observed=True).agg(
+        OrderCount_Per_Market=('OrderCount_Per_Country', 'sum'),
+        TotalSales_Per_Market=('TotalSales_Per_Country', 'sum'),
+        TotalProfit_Per_Market=('Profit', 'sum'))
+    market_order["TotalSales_Per_Market"] = np.round(market_order["TotalSales_Per_Market"])
+    market_order["TotalProfit_Per_Market"] = np.round(market_order["TotalProfit_Per_Market"])
+    country_order["TotalSales_Per_Country"] = np.round(country_order["TotalSales_Per_Country"])
+
+    country_order.index.name = 'Country'
+    total_data = country_order.reset_index().merge(market_order, how="left", on="Market")
+    return total_data[['Country', 'Market', 'iso_alpha', 'OrderCount_Per_Country', 'TotalSales_Per_Country',
+                       'OrderCount_Per_Market', 'TotalSales_Per_Market', 'TotalProfit_Per_Market']]
@@ -0,0 +1,230 @@
+import bisect
+import os
+import threading
+
+import pandas as pd
+from flask import Response, request
+
+from profiling import current, profiled, set_hook
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Runtime metrics of the app, enabled with SUPERSTORE_METRICS=1:
+#   - latency histograms of every Dash callback and of its phases: filter (rows of the bitmap index), aggregate
+#     (queries of the store, the filter time is in it) and figure (plotly figures and their JSON),
+#   - bytes of the responses of the callbacks,
+#   - memory of the rows and of every aggregate of the store, and of the process,
+#   - hits and misses of the figure cache and of the memo of the selections.
+# GET /metrics serves them in the Prometheus text format, SUPERSTORE_DEBUG_PANEL=1 shows them at the bottom of the
+# dashboard. The times come from the hook of profiling.py, so nothing is measured when the metrics are disabled.
+# Every gunicorn worker has its own metrics (the pid is in superstore_info), the background callbacks run in other
+# processes and only their responses are counted.
+
+METRICS = os.environ.get('SUPERSTORE_METRICS', '0') == '1'
+DEBUG_PANEL = METRICS and os.environ.get('SUPERSTORE_DEBUG_PANEL', '0') == '1'
+
+# upper bounds of the buckets, in seconds and in bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAYLOAD_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# phase of the metrics for every stage of profiling.py
+PHASES = {'callback': 'total', 'filter': 'filter', 'pandas': 'aggregate', 'plotly': 'figure'}
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels.items()) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # upper bound of the bucket of the quantile q (0 to 1)
+    def quantile(self, q):
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen and seen >= q * self.count:
+                return bound
+        return float('nan')
+
+    def lines(self, name, **labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield '{}_bucket{} {}'.format(name, _labels(**labels, le=_number(bound)), cumulative)
+        yield '{}_sum{} {}'.format(name, _labels(**labels), _number(self.sum))
+        yield '{}_count{} {}'.format(name, _labels(**labels), self.count)
+
+
+# resident memory of the process (linux), None when it's not known
+def get_resident_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = {}
+        self.payload = {}
+        self._callbacks = {}
+        self._memory = None
+        self._previous_hook = None
+        self._lock = threading.Lock()
+        # times of the phases of the callback running in the thread
+        self._calls = threading.local()
+
+    def _observe(self, histograms, key, buckets, value):
+        with self._lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # hook of profiling.py, the times of the phases of a call are added up and observed when the callback returns,
+    # the stages which don't run in a callback (startup, api) are not counted
+    def observe_stage(self, name, stage, seconds):
+        if stage == 'callback':
+            phases = getattr(self._calls, 'phases', {})
+            self._calls.phases = {}
+            phases['total'] = seconds
+            for phase, phase_seconds in phases.items():
+                self._observe(self.latency, (name, phase), LATENCY_BUCKETS, phase_seconds)
+        elif stage in PHASES and current('callback') is not None:
+            phases = getattr(self._calls, 'phases', None)
+            if phases is None:
+                phases = self._calls.phases = {}
+            phases[PHASES[stage]] = phases.get(PHASES[stage], 0.0) + seconds
+        if self._previous_hook is not None:
+            self._previous_hook(name, stage, seconds)
+
+    # in a process forked from a threaded one, the lock may be held by a thread which doesn't exist in it
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+
+    def observe_payload(self, callback, size):
+        self._observe(self.payload, callback, PAYLOAD_BUCKETS, size)
+
+    # memory of the store, counted again when the store or its version changes
+    def memory_usage(self, store):
+        memory = self._memory
+        if memory is None or memory[0] is not store or memory[1] != store.version:
+            memory = self._memory = (store, store.version, store.memory_usage())
+        return memory[2]
+
+    # hits and misses of every cache, caches() returns {name: (hits, misses)}
+    @staticmethod
+    def cache_counts(store, caches):
+        counts = dict(caches())
+        if store is not None:
+            counts['selections'] = (store.selection_hits, store.selection_misses)
+        return counts
+
+    # the metrics in the Prometheus text format
+    def render(self, store, caches):
+        with self._lock:
+            latency = sorted(self.latency.items())
+            payload = sorted(self.payload.items())
+
+        lines = ['# HELP superstore_info Process of the metrics.', '# TYPE superstore_info gauge',
+                 'superstore_info{} 1'.format(_labels(pid=os.getpid()))]
+        lines += ['# HELP superstore_callback_seconds Time of the Dash callbacks and of their phases.',
+                  '# TYPE superstore_callback_seconds histogram']
+        for (callback, phase), histogram in latency:
+            lines += histogram.lines('superstore_callback_seconds', callback=callback, phase=phase)
+        lines += ['# HELP superstore_callback_response_bytes Bytes of the responses of the Dash callbacks.',
+                  '# TYPE superstore_callback_response_bytes histogram']
+        for callback, histogram in payload:
+            lines += histogram.lines('superstore_callback_response_bytes', callback=callback)
+
+        lines += ['# HELP superstore_cache_requests_total Requests of the caches found (hit) or computed (miss).',
+                  '# TYPE superstore_cache_requests_total counter']
+        for cache, (hits, misses) in sorted(self.cache_counts(store, caches).items()):
+            lines.append('superstore_cache_requests_total{} {}'.format(_labels(cache=cache, result='hit'), hits))
+            lines.append('superstore_cache_requests_total{} {}'.format(_labels(cache=cache, result='miss'), misses))
+
+        lines += ['# HELP superstore_memory_bytes Memory of the rows and of the aggregates of the store.',
+                  '# TYPE superstore_memory_bytes gauge']
+        if store is not None:
+            for part, size in sorted(self.memory_usage(store).items()):
+                lines.append('superstore_memory_bytes{} {}'.format(_labels(part=part), size))
+            lines += ['# HELP superstore_dataset_version Version of the dataset (new orders appended).',
+                      '# TYPE superstore_dataset_version gauge', 'superstore_dataset_version {}'.format(store.version)]
+        resident = get_resident_bytes()
+        if resident is not None:
+            lines += ['# HELP superstore_process_resident_bytes Resident memory of the process.',
+                      '# TYPE superstore_process_resident_bytes gauge',
+                      'superstore_process_resident_bytes {}'.format(resident)]
+        return '\n'.join(lines) + '\n'
+
+    # tables of the debug panel: the callbacks, the caches and the memory
+    def summary(self, store, caches):
+        with self._lock:
+            latency = sorted(self.latency.items())
+            payload = dict(self.payload)
+
+        callbacks = pd.DataFrame(
+            [(callback, phase, histogram.count, histogram.sum / histogram.count * 1000,
+              histogram.quantile(0.95) * 1000,
+              payload[callback].sum / payload[callback].count / 1024 if phase == 'total' and callback in payload
+              else None)
+             for (callback, phase), histogram in latency],
+            columns=['Callback', 'Phase', 'Calls', 'Mean ms', 'p95 ms (at most)', 'Response KB'])
+        caches = pd.DataFrame([(cache, hits, misses, hits / (hits + misses) if hits + misses else 0.0)
+                               for cache, (hits, misses) in sorted(self.cache_counts(store, caches).items())],
+                              columns=['Cache', 'Hits', 'Misses', 'Hit rate'])
+        memory = {} if store is None else dict(self.memory_usage(store))
+        resident = get_resident_bytes()
+        if resident is not None:
+            memory['process (resident)'] = resident
+        memory = pd.DataFrame([(part, size / 2 ** 20) for part, size in memory.items()], columns=['Memory', 'MB'])
+        return callbacks, caches, memory
+
+    # time every callback of the dash app (the ones registered later too when it's called again), count the bytes of
+    # their responses and serve /metrics
+    def register(self, dash_app, get_store, caches):
+        self._previous_hook = set_hook(self.observe_stage)
+        self.instrument_callbacks(dash_app)
+        server = dash_app.server
+
+        @server.after_request
+        def count_payload(response):
+            if request.path.endswith('/_dash-update-component') and response.status_code == 200:
+                body = request.get_json(silent=True) or {}
+                callback = self._callbacks.get(body.get('output'))
+                if callback is not None and response.content_length is not None:
+                    self.observe_payload(callback, response.content_length)
+            return response
+
+        @server.route('/metrics')
+        def prometheus_metrics():
+            return Response(self.render(get_store(), caches), mimetype='text/plain; version=0.0.4')
+
+    def instrument_callbacks(self, dash_app):
+        for output, callback in dash_app.callback_map.items():
+            function = callback.get('callback')
+            if function is not None and output not in self._callbacks:
+                callback['callback'] = profiled('callback')(function)
+                self._callbacks[output] = function.__name__
+
+
+metrics = Metrics()
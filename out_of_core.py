@@ -0,0 +1,170 @@
+import os
+import time
+
+import pandas as pd
+
+from cube import MEASURES, build_cube, merge_cubes
+from data_cache import DATE_COLUMNS, add_date_parts
+from dataset import DATA_PATH, BaseStore, get_nbytes
+from iso_resolver import add_iso_codes
+from map_data import get_country_table, get_country_totals, merge_country_totals, update_country_table
+from timeseries import build_daily, merge_daily
+from top_n import build_rankings, merge_rankings
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Out-of-core mode (SUPERSTORE_OUT_OF_CORE=1) for the datasets which don't fit in the memory of the server.
+# The source is read in chunks: a CSV with pd.read_csv(chunksize=...), or a Parquet dataset partitioned by
+# order_year (order_year=2013/...) where only the partitions of the selected years are read (SUPERSTORE_YEARS).
+# Only the aggregates of the dashboard are kept: the cube (monthly chart, KPIs, pies), the totals per year and
+# country (map, market graph), the daily measures (time series) and the rankings of the top-N tables. A chunk is
+# released before the next one is read, so the memory used while loading depends on SUPERSTORE_MEMORY_BUDGET_MB and
+# on the size of the aggregates, not on the size of the dataset.
+
+OUT_OF_CORE = os.environ.get('SUPERSTORE_OUT_OF_CORE', '0') == '1'
+SOURCE_PATH = os.environ.get('SUPERSTORE_SOURCE', DATA_PATH)
+MEMORY_BUDGET_MB = int(os.environ.get('SUPERSTORE_MEMORY_BUDGET_MB', 256))
+
+# years to load, e.g. SUPERSTORE_YEARS=2013,2014 (all of them when it's empty)
+YEARS = [int(year) for year in os.environ.get('SUPERSTORE_YEARS', '').split(',') if year.strip()] or None
+
+# the only columns read from the source
+SOURCE_COLUMNS = ['Order ID', 'Order Date', 'Segment', 'Country', 'Market', 'Category', 'Sub-Category', 'City',
+                  'Product Name', 'Sales', 'Quantity', 'Discount', 'Profit', 'iso_alpha']
+BATCH_COLUMNS = SOURCE_COLUMNS + ['order_year', 'order_month']
+# types of the columns of the new orders (see prepare_batch), the other columns are text
+BATCH_DTYPES = {column: 'object' for column in BATCH_COLUMNS}
+BATCH_DTYPES.update({column: 'datetime64[ns]' for column in DATE_COLUMNS})
+BATCH_DTYPES.update({column: 'float64' for column in MEASURES})
+BATCH_DTYPES.update({'order_year': 'int64', 'order_month': 'int64'})
+
+# the columns of the dropdowns
+VALUE_COLUMNS = ['order_year', 'Segment', 'Category']
+
+# a chunk takes about this many times its size while it's parsed and aggregated
+CHUNK_OVERHEAD = 4
+MIN_CHUNK_ROWS = 1000
+
+
+def get_chunk_rows(sample, budget_bytes):
+    bytes_per_row = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+    return max(MIN_CHUNK_ROWS, int(budget_bytes / (bytes_per_row * CHUNK_OVERHEAD)))
+
+
+# parse the dates, resolve the missing iso_alpha codes and keep the rows of the years
+def prepare_chunk(chunk, years=None):
+    for column in DATE_COLUMNS:
+        if not pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk[column] = pd.to_datetime(chunk[column], infer_datetime_format=True)
+    add_date_parts(chunk)
+    add_iso_codes(chunk)
+    if years is not None:
+        chunk = chunk[chunk['order_year'].isin(years)]
+    return chunk
+
+
+def read_csv_chunks(csv_path, budget_bytes, years=None):
+    # the source may have no iso_alpha column
+    usecols = SOURCE_COLUMNS.__contains__
+    sample = pd.read_csv(csv_path, usecols=usecols, nrows=10000)
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=get_chunk_rows(sample, budget_bytes)):
+        yield prepare_chunk(chunk, years)
+
+
+# the partitions of the other years are not read (the filter is pushed down to the dataset scan)
+def read_parquet_chunks(path, budget_bytes, years=None):
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    columns = [column for column in SOURCE_COLUMNS if column in dataset.schema.names]
+    row_filter = None
+    if years is not None and 'order_year' in dataset.schema.names:
+        row_filter = ds.field('order_year').isin(years)
+
+    sample = dataset.head(10000, columns=columns, filter=row_filter).to_pandas()
+    for batch in dataset.to_batches(columns=columns, filter=row_filter,
+                                    batch_size=get_chunk_rows(sample, budget_bytes)):
+        yield prepare_chunk(batch.to_pandas(), years)
+
+
+def read_chunks(path, budget_bytes, years=None):
+    if os.path.isdir(path) or path.endswith('.parquet'):
+        return read_parquet_chunks(path, budget_bytes, years)
+    return read_csv_chunks(path, budget_bytes, years)
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Store of the aggregates only, it answers the same queries as DataStore (see BaseStore).
+# The rows are not kept, new orders are added to the aggregates.
+# The daily measures and the rankings are dense arrays of all the days and items, merging them for every chunk
+# would copy them once per chunk. The partials of the chunks are kept and merged together when they take as much
+# memory as the merged ones, so every value is copied a few times and the partials take about the size of the
+# aggregates.
+
+class ChunkedStore(BaseStore):
+    def __init__(self, chunks=()):
+        super().__init__()
+        self.countries = None
+        self.iso_codes = {}
+        self.dimension_values = {column: [] for column in VALUE_COLUMNS}
+        self.dtypes = BATCH_DTYPES
+        self.rows = 0
+        self._pending = {'daily': [], 'rankings': []}
+
+        for chunk in chunks:
+            self.add_chunk(chunk, merge=False)
+        self._merge_pending()
+        if self.cube is None:
+            raise ValueError('the source has no orders')
+
+    def values(self, column):
+        return list(self.dimension_values[column])
+
+    # add the aggregates of a chunk of orders, the daily measures and the rankings are merged later unless merge is set
+    def add_chunk(self, chunk, merge=True):
+        if chunk.empty:
+            return
+        cube = build_cube(chunk)
+        totals = get_country_totals(chunk, by=['order_year'])
+        daily = build_daily(chunk)
+        rankings = build_rankings(chunk)
+        iso_codes = chunk[['Country', 'iso_alpha']].dropna().drop_duplicates('Country')
+
+        with self.lock:
+            if self.cube is None:
+                self.cube, self.country_totals = cube, totals
+                self.countries = get_country_table(chunk)
+            else:
+                self.cube = merge_cubes(self.cube, cube)
+                self.country_totals = merge_country_totals([self.country_totals, totals])
+                self.countries = update_country_table(self.countries, chunk)
+            self._pending['daily'].append(daily)
+            self._pending['rankings'].append(rankings)
+            self._merge_pending(all_of_them=merge)
+            self.iso_codes.update(zip(iso_codes['Country'], iso_codes['iso_alpha']))
+            for column, values in self.dimension_values.items():
+                values.extend(value for value in pd.unique(chunk[column].dropna()) if value not in values)
+            self.rows += len(chunk)
+
+    # merge the partial daily measures and rankings, only the ones which take as much memory as the merged aggregate
+    # unless all_of_them is set
+    def _merge_pending(self, all_of_them=True):
+        with self.lock:
+            for name, merge in [('daily', merge_daily), ('rankings', merge_rankings)]:
+                parts = self._pending[name]
+                merged = getattr(self, '_' + name)
+                if parts and (all_of_them or merged is None or get_nbytes(parts) >= get_nbytes(merged)):
+                    setattr(self, '_' + name, merge(([] if merged is None else [merged]) + parts))
+                    parts.clear()
+
+    def append(self, batch):
+        with self.lock:
+            self.add_chunk(batch)
+            self._selections = {}
+            self.version += 1
+
+
+def load_chunked_store(path=SOURCE_PATH, budget_mb=MEMORY_BUDGET_MB, years=YEARS):
+    start = time.perf_counter()
+    store = ChunkedStore(read_chunks(path, budget_mb * 2 ** 20, years))
+    print('aggregated {:,} rows from {} in {:.2f}s'.format(store.rows, path, time.perf_counter() - start))
+    return store
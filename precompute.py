@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, reduce
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube, merge_cubes
+from map_data import get_country_totals, merge_country_totals
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Aggregates of the dataset computed in parallel when it's loaded: the cube (monthly measures per year, segment and
+# category) and the orders, sales and profit per year and country (map and market graphs).
+# The rows are split in partitions of PARTITION_ROWS rows, every partition gives a partial cube and partial totals
+# and they are merged in the order of the partitions. The partitions don't depend on the number of workers, so the
+# aggregates are the same with one worker (serial) and with a pool of processes (SUPERSTORE_PRECOMPUTE_WORKERS,
+# all the cores by default). The pool is not forked: the dataset is loaded in a background thread while the server
+# threads are running, and a forked child could start with a lock held by one of them. The workers are started by
+# a fork server (spawn without it) and map the column cache of the dataset themselves (load_rows), so only the
+# bounds of the partitions and the partial aggregates are sent between the processes. Without load_rows
+# (e.g. a dataset which is not in the cache) the partitions are sent to the workers.
+# The other aggregates built per partition (the rankings of top_n.py) use the same pool with their own
+# build_partial and merge functions.
+
+PRECOMPUTE_WORKERS = int(os.environ.get('SUPERSTORE_PRECOMPUTE_WORKERS', os.cpu_count() or 1))
+PARTITION_ROWS = 1000000
+
+# the dataset of a worker, read by its first partition
+_data = None
+
+
+def partial_aggregates(part):
+    return build_cube(part), get_country_totals(part, by=['order_year'])
+
+
+def _partition_aggregates(build_partial, load_rows, bounds):
+    global _data
+    if _data is None:
+        _data = load_rows()
+    start, stop = bounds
+    return build_partial(_data.iloc[start:stop])
+
+
+def merge_partials(partials):
+    cubes, totals = zip(*partials)
+    return reduce(merge_cubes, cubes), merge_country_totals(list(totals))
+
+
+def precompute_aggregates(data, workers=PRECOMPUTE_WORKERS, partition_rows=PARTITION_ROWS,
+                          build_partial=partial_aggregates, merge=merge_partials, load_rows=None):
+    bounds = [(start, min(start + partition_rows, len(data))) for start in range(0, max(len(data), 1), partition_rows)]
+    workers = min(workers, len(bounds))
+
+    if workers <= 1:
+        partials = [build_partial(data.iloc[start:stop]) for start, stop in bounds]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            if load_rows is not None:
+                partials = list(pool.map(partial(_partition_aggregates, build_partial, load_rows), bounds))
+            else:
+                partials = list(pool.map(build_partial, (data.iloc[start:stop] for start, stop in bounds)))
+    return merge(partials)
+
+
+# -------------------------------------------------------------------------------------------------------------------------
+# the totals of the countries as arrays, to save them with the aggregates of the cache (see load_aggregate)
+
+def country_totals_to_arrays(totals):
+    arrays = {name: totals.index.get_level_values(name).to_numpy() for name in totals.index.names}
+    arrays.update({column: totals[column].to_numpy() for column in totals.columns})
+    return arrays
+
+
+def country_totals_from_arrays(arrays):
+    columns = ['OrderCount_Per_Country', 'TotalSales_Per_Country', 'Profit']
+    totals = pd.DataFrame({name: np.asarray(arrays[name]) for name in ['order_year', 'Country'] + columns})
+    return totals.set_index(['order_year', 'Country'])
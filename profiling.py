@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+from functools import wraps
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Opt-in timing of the callbacks and of their stages: 'pandas' for the aggregates of the filters, 'plotly' for building
+# and serializing the figures and 'callback' for the whole callback.
+# Nothing is measured while no hook is set. With SUPERSTORE_PROFILE=1 the times are printed,
+# the benchmarks set their own hook to collect them (benchmarks/callback_benchmark.py) and the metrics of the app
+# too (metrics.py). A function called by another one of the same stage is not timed again, its time is in the
+# time of the first one.
+
+_hook = None
+# the profiled function running in the thread for every stage
+_running = threading.local()
+
+
+# hook(name, stage, seconds) is called after every profiled function, None stops the timing
+def set_hook(hook):
+    global _hook
+    previous, _hook = _hook, hook
+    return previous
+
+
+def print_hook(name, stage, seconds):
+    print('{:<28} {:<8} {:9.2f} ms'.format(name, stage, seconds * 1000))
+
+
+# name of the profiled function of the stage running in this thread, e.g. the callback of a 'pandas' stage
+def current(stage):
+    return getattr(_running, stage, None)
+
+
+def profiled(stage):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            hook = _hook
+            if hook is None or getattr(_running, stage, None) is not None:
+                return function(*args, **kwargs)
+            setattr(_running, stage, function.__name__)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                setattr(_running, stage, None)
+                hook(function.__name__, stage, seconds)
+        return wrapper
+    return decorator
+
+
+if os.environ.get('SUPERSTORE_PROFILE', '0') == '1':
+    set_hook(print_hook)
@@ -0,0 +1,57 @@
+import threading
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Coalescing of identical computations running at the same time (single-flight).
+# When many users pick the same year at the same moment, the first request computes the figure or the aggregate
+# and the requests for the same key which arrive meanwhile wait for it and get the same result, instead of
+# computing it again on every thread. An error of the computation is raised in all the waiting threads.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # result of compute() for the key, computed once for the threads that ask for it at the same time
+    def do(self, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    # in a process forked from a threaded one, the calls in flight belong to threads which don't exist in it
+    def reset_after_fork(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
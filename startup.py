@@ -0,0 +1,53 @@
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Startup of the app in a background thread.
+# The server answers right away (with a loading page) while the dataset is loaded and the aggregates and the figures
+# are precomputed, the time spent in every phase is kept for the readiness endpoint.
+
+
+class Startup:
+    def __init__(self):
+        self.phases = {}
+        self.current_phase = None
+        self.error = None
+        self.started = time.time()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @contextmanager
+    def phase(self, name):
+        self.current_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+            self.current_phase = None
+
+    # run the startup function in a thread, the app is ready when it returns
+    def run(self, load):
+        def target():
+            try:
+                load()
+                self._ready.set()
+            except Exception:
+                self.error = traceback.format_exc()
+                print(self.error)
+
+        thread = threading.Thread(target=target, name='startup', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        return {'ready': self.ready, 'phase': self.current_phase, 'phases': dict(self.phases),
+                'seconds': round(time.time() - self.started, 3), 'error': self.error}
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from cube import MEASURES
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Daily measures of the orders as cumulative sums, for the date ranges, the granularities (day, week, month...),
+# the rolling windows and the comparison with the year before.
+# prefix[d, s, c] is the sum of the measures of the days before the day d (d days after 'first_day') for the
+# segment s and the category c. The last segment and the last category are all of them, so the sum of any
+# range of days for any filter is prefix[stop] - prefix[start], it doesn't depend on the number of days or orders.
+# It's built once when the dataset is loaded (a bincount of the rows), new orders are merged to it.
+
+GRANULARITIES = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+
+def build_daily(df):
+    days = df['Order Date'].to_numpy(dtype='datetime64[D]')
+    segments = np.sort(df['Segment'].unique())
+    categories = np.sort(df['Category'].unique())
+    first_day = days.min() if len(days) else np.datetime64('1970-01-01', 'D')
+
+    day_idx = (days - first_day).astype(np.int64)
+    segment_idx = np.searchsorted(segments, df['Segment'].to_numpy())
+    category_idx = np.searchsorted(categories, df['Category'].to_numpy())
+
+    shape = (int(day_idx.max()) + 1 if len(days) else 0, len(segments), len(categories))
+    cell = np.ravel_multi_index((day_idx, segment_idx, category_idx), shape)
+    values = np.empty(shape + (len(MEASURES),))
+    for m, measure in enumerate(MEASURES):
+        values[..., m] = np.bincount(cell, weights=df[measure].to_numpy(dtype=float),
+                                     minlength=int(np.prod(shape))).reshape(shape)
+    return get_daily(first_day, segments, categories, values)
+
+
+# the prefix sums of the daily values, with the totals of all the segments and all the categories
+def get_daily(first_day, segments, categories, values):
+    days, n_segments, n_categories, n_measures = values.shape
+    totals = np.zeros((days + 1, n_segments + 1, n_categories + 1, n_measures))
+    totals[1:, :n_segments, :n_categories] = values
+    totals[1:, n_segments, :n_categories] = values.sum(axis=1)
+    totals[1:, :, n_categories] = totals[1:, :, :n_categories].sum(axis=2)
+    return {'first_day': np.array([first_day], dtype='datetime64[D]'), 'segments': segments,
+            'categories': categories, 'prefix': np.cumsum(totals, axis=0)}
+
+
+# daily values of the segments and the categories (without the totals)
+def get_daily_values(daily):
+    prefix = daily['prefix'][:, :len(daily['segments']), :len(daily['categories'])]
+    return np.diff(prefix, axis=0)
+
+
+def _days(day, first_day):
+    return int((day - first_day) // np.timedelta64(1, 'D'))
+
+
+# add the daily values of the aggregates, the days are the union of the days of all of them
+def merge_daily(parts):
+    if len(parts) == 1:
+        return parts[0]
+    first_day = min(daily['first_day'][0] for daily in parts)
+    days = max(_days(daily['first_day'][0], first_day) + len(daily['prefix']) - 1 for daily in parts)
+    segments = np.unique(np.concatenate([daily['segments'] for daily in parts])).astype(object)
+    categories = np.unique(np.concatenate([daily['categories'] for daily in parts])).astype(object)
+
+    values = np.zeros((days, len(segments), len(categories), len(MEASURES)))
+    for daily in parts:
+        offset = _days(daily['first_day'][0], first_day)
+        daily_values = get_daily_values(daily)
+        position = np.ix_(np.arange(offset, offset + len(daily_values)), np.searchsorted(segments, daily['segments']),
+                          np.searchsorted(categories, daily['categories']))
+        values[position] += daily_values
+    return get_daily(first_day, segments, categories, values)
+
+
+def date_range(daily):
+    first_day = pd.Timestamp(daily['first_day'][0])
+    return first_day, first_day + pd.Timedelta(days=len(daily['prefix']) - 2)
+
+
+# position of a filter option, the last one is all the values, None when the value is not in the orders
+def _filter_index(labels, option):
+    if option is None:
+        return len(labels)
+    position = np.searchsorted(labels, option)
+    if position == len(labels) or labels[position] != option:
+        return None
+    return position
+
+
+# sums of the measures between the days starts (included) and stops (excluded), arrays of datetime64[D]
+def range_sums(daily, starts, stops, segment=None, category=None):
+    segment_idx = _filter_index(daily['segments'], segment)
+    category_idx = _filter_index(daily['categories'], category)
+    if segment_idx is None or category_idx is None:
+        return np.zeros((len(starts), len(MEASURES)))
+
+    prefix = daily['prefix'][:, segment_idx, category_idx]
+    first_day, last = daily['first_day'][0], len(prefix) - 1
+    starts = np.clip((np.asarray(starts, dtype='datetime64[D]') - first_day).astype(np.int64), 0, last)
+    stops = np.clip((np.asarray(stops, dtype='datetime64[D]') - first_day).astype(np.int64), 0, last)
+    return prefix[np.maximum(stops, starts)] - prefix[starts]
+
+
+# first day of the buckets of the granularity between start and end (included), with the day after the last one
+def get_buckets(start, end, granularity='month'):
+    if granularity not in GRANULARITIES:
+        raise ValueError('unknown granularity: {}'.format(granularity))
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    periods = pd.period_range(start, end, freq=GRANULARITIES[granularity])
+    bounds = np.maximum(periods.start_time.to_numpy(dtype='datetime64[D]'), np.datetime64(start.date(), 'D'))
+    return np.append(bounds, np.datetime64(end.date(), 'D') + 1)
+
+
+# measures of every bucket of the range, with the rolling sums of the window days ending on the last day of every
+# bucket and the measures of the same days one year before
+def get_time_series(daily, start=None, end=None, granularity='month', segment=None, category=None,
+                    window=None, yoy=False):
+    first_day, last_day = date_range(daily)
+    start = first_day if start is None else pd.Timestamp(start)
+    end = last_day if end is None else pd.Timestamp(end)
+    if end < start:
+        raise ValueError('the end of the range is before its start')
+
+    bounds = get_buckets(start, end, granularity)
+    starts, stops = bounds[:-1], bounds[1:]
+    series = pd.DataFrame(range_sums(daily, starts, stops, segment, category), columns=MEASURES)
+    series.insert(0, 'date', pd.to_datetime(starts))
+
+    if window:
+        rolling = range_sums(daily, stops - np.timedelta64(int(window), 'D'), stops, segment, category)
+        for m, measure in enumerate(MEASURES):
+            series[measure + '_rolling'] = rolling[:, m]
+    if yoy:
+        year_before = pd.DateOffset(years=1)
+        last_year = range_sums(daily, (pd.to_datetime(starts) - year_before).to_numpy(dtype='datetime64[D]'),
+                               (pd.to_datetime(stops) - year_before).to_numpy(dtype='datetime64[D]'),
+                               segment, category)
+        for m, measure in enumerate(MEASURES):
+            series[measure + '_last_year'] = last_year[:, m]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                series[measure + '_yoy'] = np.where(last_year[:, m] != 0,
+                                                    (series[measure] - last_year[:, m]) / np.abs(last_year[:, m]),
+                                                    np.nan)
+    return series
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from cube import _axis_index
+from precompute import PARTITION_ROWS, PRECOMPUTE_WORKERS, precompute_aggregates
+
+# -------------------------------------------------------------------------------------------------------------------------
+# Top-N drill-down of the sub-categories, the cities and the products for the year, segment and category filters.
+# rankings['<dimension>.values'][y, s, c, i] are the sales, profit, quantity and order lines of the item i
+# ('<dimension>.items', sorted) for the year y, the segment s and the category c. They are built per partition of the
+# rows by the pool of the precompute (partial aggregates, see precompute.py) and the partials are added together.
+# A query sums the cells of the filters (the items are a few thousands, not the rows), picks the N best items with
+# np.argpartition, which is linear in the number of items, and sorts only these N, so the thousands of products
+# are never sorted. New orders are merged to the rankings like the cube.
+
+TOP_DIMENSIONS = ['Sub-Category', 'City', 'Product Name']
+TOP_MEASURES = ['Sales', 'Profit', 'Quantity']
+# the measures of the items and their number of order lines, an item without orders in the filters is not ranked
+TOP_COLUMNS = TOP_MEASURES + ['Orders']
+TOP_N = 10
+
+
+# sorted labels of the column and the position of every row in them (-1 for the missing values)
+def _item_codes(column):
+    codes, uniques = pd.factorize(column)
+    labels = np.asarray(uniques.astype(str), dtype=object)
+    order = np.argsort(labels)
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    return np.where(codes >= 0, position[codes], -1), labels[order]
+
+
+def build_rankings(df):
+    years = np.sort(df['order_year'].unique())
+    segments = np.sort(df['Segment'].unique())
+    categories = np.sort(df['Category'].unique())
+
+    year_idx = np.searchsorted(years, df['order_year'].to_numpy())
+    segment_idx = np.searchsorted(segments, df['Segment'].to_numpy())
+    category_idx = np.searchsorted(categories, df['Category'].to_numpy())
+    weights = [df[measure].to_numpy(dtype=float) for measure in TOP_MEASURES] + [None]
+
+    rankings = {'years': years, 'segments': segments, 'categories': categories}
+    for dimension in TOP_DIMENSIONS:
+        item_idx, items = _item_codes(df[dimension])
+        rows = item_idx >= 0
+        shape = (len(years), len(segments), len(categories), len(items))
+        cell = np.ravel_multi_index((year_idx[rows], segment_idx[rows], category_idx[rows], item_idx[rows]), shape)
+
+        values = np.empty(shape + (len(TOP_COLUMNS),))
+        for m, measure_weights in enumerate(weights):
+            values[..., m] = np.bincount(cell, weights=None if measure_weights is None else measure_weights[rows],
+                                         minlength=int(np.prod(shape))).reshape(shape)
+        rankings[dimension + '.items'] = items
+        rankings[dimension + '.values'] = values
+    return rankings
+
+
+# add the rankings of the partitions, the labels of the result are the union of their labels
+def merge_rankings(parts):
+    if len(parts) == 1:
+        return parts[0]
+    merged = {}
+    for axis in ['years', 'segments', 'categories']:
+        merged[axis] = np.unique(np.concatenate([part[axis] for part in parts]))
+        if axis != 'years':
+            merged[axis] = merged[axis].astype(object)
+
+    for dimension in TOP_DIMENSIONS:
+        items = np.unique(np.concatenate([part[dimension + '.items'] for part in parts])).astype(object)
+        values = np.zeros((len(merged['years']), len(merged['segments']), len(merged['categories']), len(items),
+                           len(TOP_COLUMNS)))
+        for part in parts:
+            position = np.ix_(np.searchsorted(merged['years'], part['years']),
+                              np.searchsorted(merged['segments'], part['segments']),
+                              np.searchsorted(merged['categories'], part['categories']),
+                              np.searchsorted(items, part[dimension + '.items']))
+            values[position] += part[dimension + '.values']
+        merged[dimension + '.items'] = items
+        merged[dimension + '.values'] = values
+    return merged
+
+
+# the rankings of the dataset from the partial rankings of its partitions, computed by the pool of the precompute
+def precompute_rankings(data, workers=PRECOMPUTE_WORKERS, partition_rows=PARTITION_ROWS, load_rows=None):
+    return precompute_aggregates(data, workers, partition_rows, build_partial=build_rankings,
+                                 merge=merge_rankings, load_rows=load_rows)
+
+
+# the N items with the most of the measure for the filters, with all their measures
+def top_items(rankings, dimension, year=None, segment=None, category=None, n=TOP_N, measure='Sales'):
+    if dimension not in TOP_DIMENSIONS:
+        raise ValueError('unknown dimension: {}'.format(dimension))
+    if measure not in TOP_MEASURES:
+        raise ValueError('unknown measure: {}'.format(measure))
+    if n < 1:
+        raise ValueError('n must be at least 1')
+    year = None if year is None else int(year)
+
+    values = rankings[dimension + '.values'][_axis_index(rankings['years'], year)]
+    values = values[:, _axis_index(rankings['segments'], segment)][:, :, _axis_index(rankings['categories'], category)]
+    totals = values.sum(axis=(0, 1, 2))
+
+    # the items of the filters, then the n largest ones without sorting the others
+    items = np.flatnonzero(totals[:, TOP_COLUMNS.index('Orders')] > 0)
+    ranked = totals[items, TOP_COLUMNS.index(measure)]
+    top = np.arange(len(items))
+    if len(items) > n:
+        top = np.argpartition(-ranked, n - 1)[:n]
+    labels = rankings[dimension + '.items'][items[top]]
+    top = top[np.lexsort((labels, -ranked[top]))]
+    items = items[top]
+
+    top_data = pd.DataFrame(totals[items], columns=TOP_COLUMNS)
+    top_data['Orders'] = top_data['Orders'].astype(np.int64)
+    top_data.insert(0, dimension, rankings[dimension + '.items'][items])
+    return top_data